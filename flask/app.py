@@ -1,18 +1,169 @@
 import os
-from flask import Flask, request, jsonify
-from groq import Groq
+import time
+from flask import Flask, request, jsonify, Response, stream_with_context, g, got_request_exception, send_from_directory
 import requests
-from PyPDF2 import PdfReader
-from io import BytesIO
 import re
 import json
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv  # Import dotenv
 
-# Load environment variables from .env
+# Load environment variables from .env before the project modules below,
+# which read their settings when they are imported
 load_dotenv()
 
+from pdf_ingest import PdfTooLargeError
+import pdf_cache
+from pdf_cache import get_pdf_text
+import jobs
+import metrics
+import profiling
+import scheduler
+from llm_cache import response_cache
+import llm_gateway
+from llm_gateway import LLMUnavailableError
+from grading import chunk_text, reduce_grades, GRADE_CHUNK_TOKENS
+from streaming import JsonArrayStreamParser, sse_event
+import structured_output
+import prompt_budget
+from structured_output import StructuredOutputError
+from tag_classifier import assign_tags_locally, classifier as tag_classifier, TAGS, TAG_CONFIDENCE_THRESHOLD
+from similarity_index import course_key, get_index as get_similarity_index, SIMILARITY_REUSE_THRESHOLD
+from recommender import get_ranker, RECOMMENDER_MODE, RECOMMENDER_TOP_K
+from quiz_bank import QuizBank, QUIZ_BANK_ENABLED
+from grade_store import grade_store, content_key, idempotency_key, GRADE_STORE_ENABLED
+from suggestion_cache import suggestion_cache, match_modules, band as suggestion_band, band_range as suggestion_band_range
+
 app = Flask(__name__)
 
+
+# A failing or saturated model answers 503 instead of tying up the worker
+@app.errorhandler(LLMUnavailableError)
+def llm_unavailable(e):
+    metrics.record_error(e)
+    response = jsonify({"error": str(e)})
+    if getattr(e, 'retry_after', None):
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+
+# Routes whose model calls yield to interactive traffic
+BULK_ROUTES = {"grade_batch", "assign_tags_bulk"}
+
+
+# Profile sampled requests and requests with the debug header. Registered
+# first so the capture covers the other hooks; a streamed response is
+# profiled until its stream ends.
+@app.before_request
+def start_profile():
+    capture = profiling.start(request.headers.get(profiling.PROFILE_HEADER))
+    if capture is not None:
+        g.profile = capture
+
+
+@app.teardown_request
+def finish_profile(exc):
+    capture = g.pop('profile', None)
+    if capture is not None:
+        name = capture.finish(request.endpoint or "unmatched")
+        if name is not None:
+            print(f"Profile of {request.path} written to {name}")
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+# Model calls are scheduled by priority, and fairly across the students or
+# courses they are made for
+@app.before_request
+def set_llm_priority():
+    data = request.get_json(silent=True) if request.is_json else None
+    data = data if isinstance(data, dict) else {}
+    tenant = data.get('student_id') or data.get('course_id') or request.remote_addr
+    scheduler.set_context("bulk" if request.endpoint in BULK_ROUTES else "interactive", tenant)
+
+
+# Latency and status of every request, labelled by route rather than URL
+@app.after_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        metrics.http_request_seconds.observe(
+            time.perf_counter() - start,
+            route=request.endpoint or "unmatched",
+            method=request.method,
+            status=str(response.status_code),
+        )
+    return response
+
+
+# Exceptions that escape a route and become a 500
+def record_unhandled_exception(sender, exception, **extra):
+    metrics.record_error(exception)
+
+
+got_request_exception.connect(record_unhandled_exception, app)
+
+
+# Cache counters kept by the caches themselves, read at scrape time
+def collect_pdf_cache():
+    return (
+        "edusync_pdf_cache_lookups_total", "counter", "PDF text lookups by result",
+        [({"result": result}, count) for result, count in pdf_cache.stats.items()],
+    )
+
+
+def collect_response_cache():
+    samples = []
+    for endpoint, counters in list(response_cache.stats.items()):
+        for result, count in counters.items():
+            samples.append(({"endpoint": endpoint, "result": result}, count))
+    return "edusync_llm_cache_lookups_total", "counter", "LLM response cache lookups by endpoint and result", samples
+
+
+def collect_singleflight():
+    samples = []
+    for endpoint, counters in list(llm_gateway.inflight.stats.items()):
+        for result, count in counters.items():
+            samples.append(({"endpoint": endpoint, "result": result}, count))
+    return "edusync_llm_singleflight_total", "counter", "LLM calls made and coalesced into an in-flight call", samples
+
+
+metrics.register_collector(collect_pdf_cache)
+metrics.register_collector(collect_response_cache)
+metrics.register_collector(collect_singleflight)
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+# Recent request profiles, newest first, and their files
+@app.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    if not profiling.authorized(request.headers.get(profiling.PROFILE_HEADER)):
+        return jsonify({"error": "Forbidden."}), 403
+    return jsonify({"profiles": profiling.list_captures(request.args.get('limit', 50, type=int))})
+
+
+@app.route('/admin/profiles/<name>', methods=['GET'])
+def get_profile(name):
+    if not profiling.authorized(request.headers.get(profiling.PROFILE_HEADER)):
+        return jsonify({"error": "Forbidden."}), 403
+    if not profiling.is_capture(name):
+        return jsonify({"error": "Profile not found."}), 404
+    return send_from_directory(profiling.PROFILE_DIR, name, as_attachment=True)
+
+
+# Liveness check for load balancers and orchestrators; never calls the model
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({"status": "ok", "open_circuits": llm_gateway.open_circuits()})
+
+
 # Retrieve API key from environment variables
 groq_api_key = os.getenv("GROQ_API_KEY")
 
@@ -20,9 +171,58 @@ groq_api_key = os.getenv("GROQ_API_KEY")
 if not groq_api_key:
     raise ValueError("GROQ_API_KEY is not set in the .env file")
 
-# Initialize Groq client with API key
-client = Groq(api_key=groq_api_key)
+# Upper bound on concurrent Groq calls made by one /quiz/feedback request.
+# The shared pool is sized for many requests at once; the total number of
+# model calls is capped by the scheduler.
+FEEDBACK_MAX_WORKERS = int(os.getenv("FEEDBACK_MAX_WORKERS", "5"))
+FEEDBACK_POOL_WORKERS = int(os.getenv("FEEDBACK_POOL_WORKERS", "64"))
+feedback_executor = ThreadPoolExecutor(max_workers=FEEDBACK_POOL_WORKERS, thread_name_prefix="feedback")
+
+# Upper bound on concurrent Groq calls made for chunked /grade requests
+GRADE_MAX_WORKERS = int(os.getenv("GRADE_MAX_WORKERS", "4"))
+grade_executor = ThreadPoolExecutor(max_workers=GRADE_MAX_WORKERS, thread_name_prefix="grade")
+
+# Bounded pipeline stages for /grade/batch: PDF download and extraction, then grading
+BATCH_FETCH_WORKERS = int(os.getenv("BATCH_FETCH_WORKERS", "4"))
+BATCH_GRADE_WORKERS = int(os.getenv("BATCH_GRADE_WORKERS", "4"))
+batch_fetch_executor = ThreadPoolExecutor(max_workers=BATCH_FETCH_WORKERS, thread_name_prefix="batch-fetch")
+batch_grade_executor = ThreadPoolExecutor(max_workers=BATCH_GRADE_WORKERS, thread_name_prefix="batch-grade")
+
+# Upper bound on concurrent Groq calls for vague profiles in bulk tagging
+TAG_FALLBACK_WORKERS = int(os.getenv("TAG_FALLBACK_WORKERS", "4"))
+tag_executor = ThreadPoolExecutor(max_workers=TAG_FALLBACK_WORKERS, thread_name_prefix="tags")
+
+# Roadmaps in "parallel" mode get a short outline first and then every
+# module concurrently; "single" asks for the whole roadmap in one completion
+ROADMAP_MODE = os.getenv("ROADMAP_MODE", "parallel")
+ROADMAP_MODULES = structured_output.ROADMAP_MODULES
+ROADMAP_MODULE_WORKERS = int(os.getenv("ROADMAP_MODULE_WORKERS", "8"))
+roadmap_executor = ThreadPoolExecutor(max_workers=ROADMAP_MODULE_WORKERS, thread_name_prefix="roadmap")
+
+# Modules per module suggestions call, so each reply fits its max_tokens
+# (about 150 tokens per module), and calls run at once for one request
+MODULE_SUGGESTION_BATCH = int(os.getenv("MODULE_SUGGESTION_BATCH", "6"))
+MODULE_SUGGESTION_CONCURRENCY = int(os.getenv("MODULE_SUGGESTION_CONCURRENCY", "4"))
+suggestion_executor = ThreadPoolExecutor(max_workers=int(os.getenv("MODULE_SUGGESTION_POOL_WORKERS", "32")), thread_name_prefix="suggestions")
 
+# Number of indexed neighbours returned as relatedCourses
+SIMILAR_COURSES_K = int(os.getenv("SIMILAR_COURSES_K", "5"))
+
+
+# Clients opt into the job API with "async": true in the body or ?async=1
+def wants_async(data):
+    return data.get('async') is True or request.args.get('async') == '1'
+
+def submit_job(kind, data):
+    job_id = jobs.submit(kind, data, callback_url=data.get('callback_url'))
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify(job)
 
 
 # GRADE API 
@@ -33,56 +233,194 @@ def grade():
     # Check if required fields are present
     if not data or 'pdf_url' not in data or 'criteria' not in data:
         return jsonify({"error": "Missing 'pdf_url' or 'criteria' in the request."}), 400
-    pdf_url = data['pdf_url']
-    print(pdf_url)
-    criteria = data['criteria']
 
-    # Download the PDF from the given URL
+    # A retried request with the same Idempotency-Key gets the same grade
+    if request.headers.get('Idempotency-Key'):
+        data['idempotency_key'] = request.headers['Idempotency-Key']
+
+    # Long running work can be handed to the job queue instead
+    if wants_async(data):
+        return submit_job("grade", data)
 
+    body, status_code = grade_submission(data)
+    return (jsonify(body) if isinstance(body, dict) else body), status_code
+
+# Stored grades for reporting, never calling the model. Filters, all
+# optional and repeatable: pdf_url, idempotency_key; since (unix time),
+# after (the "next" cursor of the previous page) and limit.
+@app.route('/grades', methods=['GET'])
+def list_grades():
     try:
-        # Download the PDF content
-        response = requests.get(pdf_url)
-        response.raise_for_status()  # Ensure the request was successful
-        
-        # Load the PDF content into memory using BytesIO
-        file = BytesIO(response.content)
-        
-        # Use PyPDF2 to read and extract text from the PDF
-        reader = PdfReader(file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""  # Extract text from each page
-        text
+        since = request.args.get('since', type=float)
+        after = request.args.get('after', type=int)
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        return jsonify({"error": "'limit' must be a number."}), 400
+    grades, next_cursor = grade_store.query(
+        pdf_urls=request.args.getlist('pdf_url'),
+        keys=request.args.getlist('idempotency_key'),
+        since=since,
+        after=after,
+        limit=limit,
+    )
+    return jsonify({"grades": grades, "next": next_cursor})
+
+# Download, extract and grade one submission. Returns (body, status_code),
+# where body is a dict or, for download and extraction failures, a message.
+# Requests with an idempotency key are answered once and then from the store.
+def grade_submission(data):
+    if GRADE_STORE_ENABLED and data.get('idempotency_key'):
+        key = idempotency_key(str(data['idempotency_key']))
+        return grade_store.run(
+            key,
+            lambda: grade_pdf(data, parent=key),
+            pdf_url=data['pdf_url'],
+            criteria=data['criteria'],
+        )
+    return grade_pdf(data)
+
+def grade_pdf(data, parent=None):
+    text, error = load_submission_text(data['pdf_url'])
+    if error is not None:
+        return error
+    return grade_extracted_text(text, data, parent=parent)
+
+# Download the PDF and extract its text, reusing cached text for known PDFs.
+# Returns (text, None), or (None, (body, status_code)) when that fails.
+def load_submission_text(pdf_url):
+    try:
+        return get_pdf_text(pdf_url), None
+    except PdfTooLargeError as e:
+        metrics.record_error(e)
+        return None, ({"error": str(e)}, 413)
     except requests.exceptions.RequestException as e:
-        return f"Failed to download PDF: {str(e)}"
+        metrics.record_error(e)
+        return None, (f"Failed to download PDF: {str(e)}", 200)
     except Exception as e:
-        return f"Failed to extract text from PDF: {str(e)}"
+        metrics.record_error(e)
+        return None, (f"Failed to extract text from PDF: {str(e)}", 200)
+
+# Grade already extracted text against data['criteria']. The same text and
+# criteria are graded once; repeats get the stored grade, and a repeat that
+# arrives while it is being graded waits for it. Returns (body, status_code).
+def grade_extracted_text(text, data, parent=None):
+    if GRADE_STORE_ENABLED:
+        return grade_store.run(
+            content_key(text, data['criteria'], data.get('mode', 'auto')),
+            lambda: compute_grade(text, data),
+            pdf_url=data.get('pdf_url'),
+            criteria=data['criteria'],
+            parent=parent,
+        )
+    return compute_grade(text, data)
 
-    # Create a prompt with the criteria
+def compute_grade(text, data):
+    criteria = data['criteria']
+
+    # Long documents are graded chunk by chunk so no single call outgrows the context
+    mode = data.get('mode', 'auto')
+    if mode == 'chunked' or (mode == 'auto' and prompt_budget.count_tokens(text) > GRADE_CHUNK_TOKENS):
+        json_response = grade_text_chunked(text, criteria)
+        if json_response is None:
+            return {"error": "Response is not valid JSON."}, 500
+        return json_response, 200
+
+    # If the content is in JSON format, parse it
+    try:
+        json_response = grade_text(text, criteria)
+        return json_response, 200  # Return the JSON response
+    except StructuredOutputError as e:
+        metrics.record_error(e)
+        return {"error": "Response is not valid JSON."}, 500
+
+@app.route('/grade/batch', methods=['POST'])
+def grade_batch():
+    data = request.get_json()
+
+    # Check if required fields are present
+    items = data.get('items') if data else None
+    if not isinstance(items, list) or not all(isinstance(item, dict) and 'pdf_url' in item and 'criteria' in item for item in items):
+        return jsonify({"error": "Expected 'items', a list of objects with 'pdf_url' and 'criteria'."}), 400
+
+    # Every distinct PDF is fetched once and every distinct (PDF, criteria) pair
+    # graded once; duplicates in the batch share the result
+    results = queue.Queue()
+    groups = {}  # grading key -> item indices
+    fetches = {}  # pdf_url -> grading keys waiting for its text
+    for index, item in enumerate(items):
+        key = (item['pdf_url'], json.dumps(item['criteria']), item.get('mode', 'auto'))
+        if key not in groups:
+            groups[key] = []
+            fetches.setdefault(item['pdf_url'], []).append((key, item))
+        groups[key].append(index)
+
+    def grade_stage(key, item, text):
+        try:
+            results.put((key, grade_extracted_text(text, item)))
+        except Exception as e:
+            results.put((key, ({"error": str(e)}, 500)))
+
+    def fetch_stage(pdf_url, waiting):
+        text, error = load_submission_text(pdf_url)
+        for key, item in waiting:
+            if error is not None:
+                results.put((key, error))
+            else:
+                scheduler.submit(batch_grade_executor, grade_stage, key, item, text)
+
+    for pdf_url, waiting in fetches.items():
+        scheduler.submit(batch_fetch_executor, fetch_stage, pdf_url, waiting)
+
+    # Stream each grade as one NDJSON line as soon as it is ready
+    def generate():
+        for _ in range(len(groups)):
+            key, (body, status_code) = results.get()
+            if not isinstance(body, dict):
+                # Download and extraction failures are plain messages on /grade
+                body, status_code = {"error": str(body)}, 502
+            for index in groups[key]:
+                yield json.dumps({
+                    "index": index,
+                    "pdf_url": key[0],
+                    "status": status_code,
+                    "result": body,
+                }) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+def build_grade_prompt(text, criteria, part=None):
     criteria_list = ", ".join(criteria)
-    prompt = f"""
+    criteria_format = ",\n".join(
+        f'        "{criterion}": "Description for criterion {criterion}"' for criterion in criteria
+    )
+    # Chunks are graded on their own, so tell the model it only sees part of the work
+    scope = "the PDF content"
+    if part is not None:
+        scope = f"this excerpt (part {part[0]} of {part[1]}) of the PDF content"
+    return f"""
     You are a grading assistant. Grade the assignment based on the following criteria: {criteria_list}.
-    Provide a grade between 1 and 10 for the overall quality of the PDF content, followed by one line descriptions for each criterion.
+    Provide a grade between 1 and 10 for the overall quality of {scope}, followed by one line descriptions for each criterion.
 
     Output the result in the following JSON format
     {{
         "grade": (1-10),
-        "{criteria[0]}": "Description for criterion {criteria[0]}",
-        "{criteria[1]}": "Description for criterion {criteria[1]}",
-        "{criteria[2]}": "Description for criterion {criteria[2]}"
+{criteria_format}
     }}
 
     PDF text:
     {text}
     """
 
+def grade_text(text, criteria, part=None):
+    text = prompt_budget.fit_text("grade", "llama-3.1-8b-instant", text, max_tokens=1024)
     # Create a completion request to grade the assignment
-    completion = client.chat.completions.create(
+    json_response = structured_output.generate(
+        "grade",
         model="llama-3.1-8b-instant",
         messages=[
             {
                 "role": "user",
-                "content": prompt
+                "content": build_grade_prompt(text, criteria, part)
             }
         ],
         temperature=1,
@@ -92,20 +430,32 @@ def grade():
         response_format={"type": "json_object"},
         stop=None,
     )
-    message_content = completion.choices[0].message.content    
-    # If the content is in JSON format, parse it
-    try:
-        json_response = json.loads(message_content)  # Parse the string into a JSON object
-        return jsonify(json_response)  # Return the JSON response
-    except json.JSONDecodeError:
-        return jsonify({"error": "Response is not valid JSON."}), 500
-
-def extract_text_from_pdf(file):
-    reader = PyPDF2.PdfReader(file)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() or ""  # Handle potential None values
-    return text
+    return json_response
+
+def grade_text_chunked(text, criteria):
+    # Map: grade every chunk concurrently; reduce: merge into one result
+    chunks = chunk_text(text)
+    futures = [
+        scheduler.submit(grade_executor, grade_text, chunk, criteria, (i + 1, len(chunks)))
+        for i, chunk in enumerate(chunks)
+    ]
+    partials = []
+    weights = []
+    unavailable = None
+    for chunk, future in zip(chunks, futures):
+        try:
+            partials.append(future.result())
+            weights.append(len(chunk))
+        except Exception as e:
+            # A failed chunk only drops its share of the weighted grade
+            metrics.record_error(e)
+            print(f"Grading chunk failed: {str(e)}")
+            if isinstance(e, LLMUnavailableError):
+                unavailable = e
+    # Every chunk turned away by an overloaded model: answer 503, not a bad grade
+    if not partials and unavailable is not None:
+        raise unavailable
+    return reduce_grades(partials, weights, criteria)
 
 @app.route('/quiz', methods=['POST'])
 def quiz():
@@ -114,10 +464,37 @@ def quiz():
     # Check if required fields are present
     if not data or 'description' not in data:
         return jsonify({"error": "Missing 'description' in the request."}), 400
-    
-    print(data)
 
-    text = data['description']
+    try:
+        # Served from pre-generated questions when the bank has enough
+        if QUIZ_BANK_ENABLED:
+            json_response = quiz_bank.quiz(data['description'], data.get('course_id'), data.get('student_id'))
+        else:
+            json_response = generate_quiz(data['description'])
+        return jsonify(json_response)  # Return the JSON response
+    except StructuredOutputError as e:
+        metrics.record_error(e)
+        return jsonify({"error": "Response is not valid JSON."}), 500
+
+# Pre-generate quiz questions in the background for descriptions or courses
+# that will be quizzed soon. Body: {"description", "course_id"} or
+# {"courses": [{"description", "_id"}, ...]}.
+@app.route('/quiz/bank', methods=['POST'])
+def warm_quiz_bank():
+    data = request.get_json()
+    items = (data or {}).get('courses')
+    if items is None and data and 'description' in data:
+        items = [{"description": data['description'], "_id": data.get('course_id')}]
+    if not items or any(not isinstance(item, dict) or not item.get('description') for item in items):
+        return jsonify({"error": "Missing 'description' in the request."}), 400
+
+    pools = [quiz_bank.warm(item['description'], item.get('_id') or item.get('course_id')) for item in items]
+    return jsonify({"pools": pools}), 202
+
+# Generate five questions for a description. avoid lists questions already
+# asked, so pre-generated batches add new ones. Raises StructuredOutputError.
+def generate_quiz(description, avoid=()):
+    text = prompt_budget.fit_text("quiz", "llama-3.1-8b-instant", description, max_tokens=1024)
     # Create a prompt with the criteria
     prompt = f"""
     Generate five multiple-choice questions based on the provided topics mentioned in following desciption {text}. For each question, provide exactly four options labeled "a", "b", "c", and "d". The answer should be one of the four options: "a", "b", "c", or "d". 
@@ -149,8 +526,12 @@ def quiz():
     ]
     """
 
-    # Create a completion request to grade the assignment
-    completion = client.chat.completions.create(
+    if avoid:
+        asked = prompt_budget.fit_items("quiz", "llama-3.1-8b-instant", list(avoid), serialize=str, max_tokens=1024)
+        prompt += "\n    Do not repeat any of these questions:\n" + "\n".join(f"    - {question}" for question in asked) + "\n"
+
+    return structured_output.generate(
+        "quiz",
         model="llama-3.1-8b-instant",
         messages=[
             {
@@ -165,14 +546,48 @@ def quiz():
         response_format={"type": "json_object"},
         stop=None,
     )
-    message_content = completion.choices[0].message.content
-        
-        # If the content is in JSON format, parse it
-    try:
-        json_response = json.loads(message_content)  # Parse the string into a JSON object
-        return jsonify(json_response)  # Return the JSON response
-    except json.JSONDecodeError:
-        return jsonify({"error": "Response is not valid JSON."}), 500
+
+quiz_bank = QuizBank(generate_quiz)
+metrics.register_collector(quiz_bank.collect)
+
+def generate_question_feedback(item):
+    question = prompt_budget.fit_text("quiz_feedback", "llama-3.1-8b-instant", str(item.get('question')), max_tokens=150)
+    options = item.get('options')
+    correct_answer = item.get('answer')
+    user_answer = item.get('user_answer')
+
+    # Create a prompt for generating AI feedback with JSON template
+    prompt = f"""
+    You are an AI grading assistant. Provide feedback based on the following question, options, correct answer, and user's answer.
+
+    Question: {question}
+    Options: {options}
+    Correct Answer: {correct_answer}
+    User's Answer: {user_answer}
+
+    Generate the feedback in valid JSON format, structured as follows:
+
+    {{
+        "feedback": "Your feedback message here."
+    }}
+
+    only give feedback no need and make it polite.
+    Provide constructive feedback on the user's answer, indicating whether it was correct or not and offering tips for improvement.
+    """
+
+    # Create a completion request to generate feedback
+    json_response = llm_gateway.chat_json(
+        "quiz_feedback",
+        model="llama-3.1-8b-instant",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=1,
+        max_tokens=150,
+        top_p=1,
+        stream=False,
+        response_format={"type": "json_object"},
+        stop=None
+    )
+    return json_response
 
 @app.route('/quiz/feedback', methods=['POST'])
 def quiz_feedback():
@@ -183,71 +598,270 @@ def quiz_feedback():
         return jsonify({"error": "Missing required fields in the request."}), 400
 
     questions = data['questions']  # Expecting a list of question objects
-    feedback_list = []  # To store feedback for each question
 
+    # Validate every question item before spending any model calls
     for item in questions:
-        question = item.get('question')
-        options = item.get('options')
-        correct_answer = item.get('answer')
-        user_answer = item.get('user_answer')
-
-        # Validate each question item
-        if not question or not options or correct_answer is None or user_answer is None:
+        if not item.get('question') or not item.get('options') or item.get('answer') is None or item.get('user_answer') is None:
             return jsonify({"error": "Missing fields in one or more question items."}), 400
 
-        # Create a prompt for generating AI feedback with JSON template
-        prompt = f"""
-        You are an AI grading assistant. Provide feedback based on the following question, options, correct answer, and user's answer.
+    # Generate feedback for all questions concurrently, a few at a time per request
+    futures = scheduler.submit_bounded(feedback_executor, generate_question_feedback, questions, FEEDBACK_MAX_WORKERS)
 
-        Question: {question}
-        Options: {options}
-        Correct Answer: {correct_answer}
-        User's Answer: {user_answer}
+    feedback_list = []  # To store feedback for each question, in question order
+    unavailable = []
+    for future in futures:
+        try:
+            feedback_list.append(future.result())
+        except json.JSONDecodeError as e:
+            metrics.record_error(e)
+            # Keep the feedback already generated for the other questions
+            feedback_list.append({"error": "Response is not valid JSON."})
+        except Exception as e:
+            metrics.record_error(e)
+            print(f"Feedback generation failed: {str(e)}")
+            feedback_list.append({"error": "Failed to generate feedback."})
+            if isinstance(e, LLMUnavailableError):
+                unavailable.append(e)
+
+    # Nothing could be generated because the model is unavailable: answer 503
+    if unavailable and len(unavailable) == len(futures):
+        raise unavailable[0]
 
-        Generate the feedback in valid JSON format, structured as follows:
+    return jsonify({"feedback": feedback_list})  # Return the list of feedback responses
 
-        {{
-            "feedback": "Your feedback message here."
-        }}
+@app.route('/roadmap', methods=['POST'])
+def roadmap():
+    data = request.get_json()
 
-        only give feedback no need and make it polite.
-        Provide constructive feedback on the user's answer, indicating whether it was correct or not and offering tips for improvement.
-        """
+    # Check if required fields are present
+    if not data or 'description' not in data:
+        return jsonify({"error": "Missing 'description' in the request."}), 400
 
-        # Create a completion request to generate feedback
-        completion = client.chat.completions.create(
+    # Long running work can be handed to the job queue instead
+    if wants_async(data):
+        return submit_job("roadmap", data)
+
+    # Stream modules over SSE as they are generated when the client asks for it
+    if data.get('stream') is True or request.args.get('stream') == '1' or request.accept_mimetypes.best == 'text/event-stream':
+        return Response(
+            stream_with_context(stream_roadmap(data)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    body, status_code = generate_roadmap(data)
+    return jsonify(body), status_code
+
+# Generate a course roadmap. Returns (body, status_code).
+def generate_roadmap(data):
+    try:
+        if data.get('mode', ROADMAP_MODE) == 'parallel':
+            return generate_roadmap_parallel(data['description']), 200
+
+        # Create a completion request with adjusted parameters
+        json_response = structured_output.generate(
+            "roadmap",
             model="llama-3.1-8b-instant",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=1,
-            max_tokens=150,
-            top_p=1,
+            messages=[
+                {
+                    "role": "user",
+                    "content": build_roadmap_prompt(data['description'])
+                }
+            ],
+            temperature=0.2,  # Lower temperature for more deterministic output
+            max_tokens=4000,  # Increase token limit
+            top_p=0.9,
             stream=False,
             response_format={"type": "json_object"},
-            stop=None
+            stop=None,
         )
-        message_content = completion.choices[0].message.content
+        return json_response, 200
+    except StructuredOutputError as e:
+        metrics.record_error(e)
+        # Return both the error and the attempted response for debugging
+        return {
+            "error": "Response is not valid JSON.",
+            "attempted_response": e.content
+        }, 500
+
+# Outline, then all modules at once; latency is about the outline plus the
+# slowest module. Raises StructuredOutputError.
+def generate_roadmap_parallel(description):
+    outline = generate_roadmap_outline(description)
+    futures = [
+        scheduler.submit(roadmap_executor, generate_roadmap_module, description, outline, index)
+        for index in range(len(outline))
+    ]
+    roadmap = {"modules": [future.result() for future in futures]}
+    structured_output.check("roadmap", roadmap)
+    return roadmap
 
-        # If the content is in JSON format, parse it
-        try:
-            feedback_response = json.loads(message_content.strip())  # Parse the string into a JSON object
-            feedback_list.append(feedback_response)  # Add feedback to the list
-        except json.JSONDecodeError:
-            return jsonify({"error": "Response is not valid JSON."}), 500
+# Titles and descriptions of the roadmap's modules. An outline with too few
+# modules is asked for once more. Raises StructuredOutputError.
+def generate_roadmap_outline(description):
+    try:
+        return request_roadmap_outline(description)
+    except StructuredOutputError as e:
+        metrics.record_error(e)
+        print(f"Roadmap outline rejected, retrying: {str(e)}")
+        return request_roadmap_outline(description)
+
+def request_roadmap_outline(description):
+    text = prompt_budget.fit_text("roadmap", "llama-3.1-8b-instant", description, max_tokens=400)
+    prompt = f"""
+You are a tutor. Plan the outline of a course roadmap based on the following description: {text}
 
-    return jsonify({"feedback": feedback_list})  # Return the list of feedback responses
+Return the result as valid JSON with an array named "modules" containing {ROADMAP_MODULES} module objects in teaching order, as follows:
 
-@app.route('/roadmap', methods=['POST'])
-def roadmap():
-    data = request.get_json()
+{{
+  "modules": [
+    {{
+      "title": "Module Title",
+      "description": "One sentence module description."
+    }}
+  ]
+}}
 
-    # Check if required fields are present
-    if not data or 'description' not in data:
-        return jsonify({"error": "Missing 'description' in the request."}), 400
+Important: Return only valid JSON with exactly {ROADMAP_MODULES} modules.
+"""
+    json_response = structured_output.generate(
+        "roadmap",
+        schema="roadmap_outline",
+        model="llama-3.1-8b-instant",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.2,
+        max_tokens=400,
+        top_p=0.9,
+        stream=False,
+        response_format={"type": "json_object"},
+        stop=None,
+    )
+    # The schema guarantees at least ROADMAP_MODULES modules
+    return json_response['modules'][:ROADMAP_MODULES]
+
+# One full module of an outlined roadmap, with its order set from the
+# outline. Raises StructuredOutputError.
+def generate_roadmap_module(description, outline, index):
+    text = prompt_budget.fit_text("roadmap", "llama-3.1-8b-instant", description, max_tokens=1000)
+    planned = "\n".join(f"{i + 1}. {module['title']}: {module.get('description', '')}" for i, module in enumerate(outline))
+    module = outline[index]
+    prompt = f"""
+You are a tutor. Write one module of a course roadmap based on the following description: {text}
 
-    text = data['description']
-    
+The roadmap has these modules:
+{planned}
+
+Write Module {index + 1} of {len(outline)}, "{module['title']}", only. Return it as a valid JSON object that strictly follows this format:
+
+{{
+  "title": "{module['title']}",
+  "description": "Module description.",
+  "order": {index + 1},
+  "contents": [
+    {{
+      "type": "video",
+      "title": "Content Title",
+      "description": "Description of content.",
+      "resource": {{
+        "url": "",
+        "duration": 0,
+        "publicId": ""
+      }},
+      "tags": ["tag1", "tag2"]
+    }}
+  ],
+  "quiz": {{
+    "questions": [
+      {{
+        "question": "Question text?",
+        "options": {{
+          "a": "Option A",
+          "b": "Option B",
+          "c": "Option C",
+          "d": "Option D"
+        }},
+        "answer": "a",
+        "conceptTags": ["concept1"],
+        "difficulty": 1
+      }}
+    ],
+    "passingScore": 70
+  }}
+}}
+
+Important: Return only valid JSON for this one module, with 2-3 content items and 2-3 quiz questions.
+"""
+    json_response = structured_output.generate(
+        "roadmap",
+        schema="roadmap_module",
+        model="llama-3.1-8b-instant",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.2,
+        max_tokens=1000,
+        top_p=0.9,
+        stream=False,
+        response_format={"type": "json_object"},
+        stop=None,
+    )
+    json_response['order'] = index + 1
+    return json_response
+
+# Stream a roadmap as server-sent events, one "module" event per module as
+# soon as its JSON object is complete, then a "done" event
+def stream_roadmap(data):
+    if data.get('mode', ROADMAP_MODE) == 'parallel':
+        yield from stream_roadmap_parallel(data)
+        return
+
+    parser = JsonArrayStreamParser("modules")
+    count = 0
+    try:
+        # JSON mode is not available for streamed completions, the prompt asks for JSON
+        for delta in llm_gateway.stream_chat(
+            "roadmap",
+            model="llama-3.1-8b-instant",
+            messages=[{"role": "user", "content": build_roadmap_prompt(data['description'])}],
+            temperature=0.2,
+            max_tokens=4000,
+            top_p=0.9,
+        ):
+            for module in parser.feed(delta):
+                count += 1
+                yield sse_event("module", module)
+    except Exception as e:
+        metrics.record_error(e)
+        print(f"Roadmap stream failed: {str(e)}")
+        yield sse_event("error", {"error": str(e)})
+        return
+
+    if count == 0:
+        yield sse_event("error", {"error": "Response is not valid JSON."})
+    else:
+        yield sse_event("done", {"modules": count})
+
+# Parallel mode streams each module as it finishes, so events may arrive
+# out of order; every module carries its "order"
+def stream_roadmap_parallel(data):
+    try:
+        outline = generate_roadmap_outline(data['description'])
+        futures = [
+            scheduler.submit(roadmap_executor, generate_roadmap_module, data['description'], outline, index)
+            for index in range(len(outline))
+        ]
+        for future in as_completed(futures):
+            yield sse_event("module", future.result())
+    except Exception as e:
+        metrics.record_error(e)
+        print(f"Roadmap stream failed: {str(e)}")
+        yield sse_event("error", {"error": str(e)})
+        return
+
+    yield sse_event("done", {"modules": len(futures)})
+
+def build_roadmap_prompt(text):
+    text = prompt_budget.fit_text("roadmap", "llama-3.1-8b-instant", text, max_tokens=4000)
     # Create a simplified prompt with fewer modules
-    prompt = f"""
+    return f"""
 You are a tutor. Generate a detailed course roadmap based on the following description: {text}
 
 Return the result as valid JSON with an array named "modules" containing 4 module objects. Each module should strictly follow this format:
@@ -294,35 +908,6 @@ Return the result as valid JSON with an array named "modules" containing 4 modul
 
 Important: Return only valid JSON with exactly 4 modules. Each module should have 2-3 content items and 2-3 quiz questions.
 """
-
-    # Create a completion request with adjusted parameters
-    completion = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        temperature=0.2,  # Lower temperature for more deterministic output
-        max_tokens=4000,  # Increase token limit
-        top_p=0.9,
-        stream=False,
-        response_format={"type": "json_object"},
-        stop=None,
-    )
-    message_content = completion.choices[0].message.content
-        
-    # If the content is in JSON format, parse it
-    try:
-        json_response = json.loads(message_content)
-        return jsonify(json_response)
-    except json.JSONDecodeError:
-        # Return both the error and the attempted response for debugging
-        return jsonify({
-            "error": "Response is not valid JSON.",
-            "attempted_response": message_content
-        }), 500
     
 @app.route('/assign-student-tags', methods=['POST'])
 def assign_tags():
@@ -334,6 +919,48 @@ def assign_tags():
 
     about_text = data['about']
 
+    # Specific descriptions are tagged locally; only vague ones need the model
+    local_tags = assign_tags_locally(about_text)
+    if local_tags is not None:
+        return jsonify({"interests": local_tags})
+
+    body, status_code = assign_tags_with_llm(about_text)
+    return jsonify(body), status_code
+
+@app.route('/assign-student-tags/bulk', methods=['POST'])
+def assign_tags_bulk():
+    data = request.get_json()
+
+    # Check if required fields are present
+    profiles = data.get('profiles') if data else None
+    if not isinstance(profiles, list) or not all(isinstance(about, str) for about in profiles):
+        return jsonify({"error": "Expected 'profiles', a list of 'about' texts."}), 400
+
+    # Tag every profile in one vectorized pass
+    results = []
+    vague = []
+    for index, (tags, confidence) in enumerate(tag_classifier.classify(profiles)):
+        results.append({"interests": tags, "confidence": round(confidence, 3), "source": "local"})
+        if confidence < TAG_CONFIDENCE_THRESHOLD or not tags:
+            vague.append(index)
+
+    # Optionally ask the model about the vague profiles, a few at a time
+    if data.get('fallback') is True and vague:
+        futures = {index: scheduler.submit(tag_executor, assign_tags_with_llm, profiles[index]) for index in vague}
+        for index, future in futures.items():
+            try:
+                body, status_code = future.result()
+                if status_code == 200 and isinstance(body.get('interests'), list):
+                    results[index].update(interests=body['interests'], source="llm")
+            except Exception as e:
+                metrics.record_error(e)
+                print(f"Tag fallback failed: {str(e)}")
+
+    return jsonify({"results": results})
+
+# Assign tags with the model. Returns (body, status_code).
+def assign_tags_with_llm(about_text):
+    about_text = prompt_budget.fit_text("assign_tags", "llama-3.1-8b-instant", about_text, max_tokens=150)
     # Create a prompt to assign tags based on the student's "about" text
     prompt = f"""
     You are a tag assignment assistant. Analyze the following student description and assign the top 5 most relevant tags from the provided list.Use knn or decision tree algorithm if necessary. The tags should be relevant to the student's interests, skills, and goals. The tags returned should be diversified and cover a range of topics. If the student description is too vague look for keywords like creative, technology etc. and assign tags accordingly.
@@ -342,7 +969,7 @@ def assign_tags():
     {about_text}
 
     Available Tags:
-    Programming, Data Science, Machine Learning, Artificial Intelligence, Web Development, Mobile Development, Cloud Computing, Cybersecurity, Software Engineering, Database Management, DevOps, UI/UX Design, Game Development, Blockchain, Internet of Things (IoT), Big Data, Business Analytics, Project Management, Digital Marketing, Finance, Entrepreneurship, Leadership, Communication Skills, Creative Writing, Graphic Design, Photography, Music Production, Language Learning, Mathematics, Physics, Biology, Chemistry, History, Psychology, Philosophy.
+    {', '.join(TAGS)}.
 
     Output the result in valid JSON format with double quotes around all keys and values. The JSON format should be an array of assigned tags, as follows:
 
@@ -354,7 +981,8 @@ def assign_tags():
     """
 
     # Create a completion request to assign tags
-    completion = client.chat.completions.create(
+    message_content = llm_gateway.chat(
+        "assign_tags",
         model="llama-3.1-8b-instant",
         messages=[
             {
@@ -369,14 +997,14 @@ def assign_tags():
         response_format={"type": "json_object"},
         stop=None,
     )
-    message_content = completion.choices[0].message.content
 
     # If the content is in JSON format, parse it
     try:
         json_response = json.loads(message_content)  # Parse the string into a JSON object
-        return jsonify(json_response)  # Return the JSON response
-    except json.JSONDecodeError:
-        return jsonify({"error": "Response is not valid JSON."}), 500
+        return json_response, 200  # Return the JSON response
+    except json.JSONDecodeError as e:
+        metrics.record_error(e)
+        return {"error": "Response is not valid JSON."}, 500
 
     
 @app.route('/courses/recommendations', methods=['POST'])
@@ -394,74 +1022,73 @@ def get_course_recommendations():
         if len(courses) == 0:
             return jsonify({"success": True, "courses": []}), 200
         
-        # Prepare data for the prompt
-        courses_data = []
-        for course in courses:
-            courses_data.append({
-                "id": course["_id"],
-                "title": course.get("title", ""),  # Adding title for better context
-                "tags": course["tags"],
-            })
-        
-        # Simplified prompt with clearer instructions
-        prompt = f"""
-        You are a course recommendation system. Match user interests with course tags to find relevant courses.
-        
-        User Interests: {json.dumps(user_interests)}
-        
-        Available Courses: {json.dumps(courses_data)}
-        
-        Return a JSON object with this exact format:
-        {{
-            "recommendedItems": [
-                "course_id_1", 
-                "course_id_2"
-            ]
-        }}
-        
-        Include only course IDs in the recommendedItems array, sorted by relevance.
-        """
-
-        # Create a completion request with fallback mechanism
-        try:
-            completion = client.chat.completions.create(
-                model="deepseek-r1-distill-llama-70b",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1,  # Lower temperature for more deterministic output
-                max_tokens=500,
-                top_p=1,
-                stream=False,
-                response_format={"type": "json_object"},
-                stop=None
+        # Index the catalog once for vectorized tag matching
+        ranker = get_ranker(courses)
+
+        if RECOMMENDER_MODE == "local":
+            # The local ranker is the primary ranker, no model call needed
+            groq_data = {"recommendedItems": ranker.rank(user_interests)}
+        else:
+            # Candidates go most relevant first so the prompt budget drops the
+            # least relevant; in prefilter mode the model only sees the best ones
+            top_k = RECOMMENDER_TOP_K if RECOMMENDER_MODE == "prefilter" else None
+            candidates = [courses[i] for i in ranker.top_indices(user_interests, top_k, matched_only=False)]
+
+            # Prepare data for the prompt
+            courses_data = []
+            for course in candidates:
+                course_data = {"id": course["_id"], "tags": course["tags"]}
+                if course.get("title"):
+                    course_data["title"] = course["title"]  # Adding title for better context
+                courses_data.append(course_data)
+            courses_data = prompt_budget.fit_items(
+                "course_recommendations", "deepseek-r1-distill-llama-70b", courses_data, max_tokens=500
             )
-            message_content = completion.choices[0].message.content
-
-            # Parse the response
-            groq_data = json.loads(message_content)
-        
-        except Exception as api_error:
-            # Fallback to manual recommendation if AI fails
-            print(f"AI recommendation failed: {str(api_error)}. Using fallback method.")
             
-            # Simple fallback that matches interests to tags
-            recommended_courses = []
-            for course in courses:
-                # Calculate relevance score based on tag matches
-                score = 0
-                for interest in user_interests:
-                    if interest.lower() in [tag.lower() for tag in course["tags"]]:
-                        score += 1
-                
-                if score > 0:  # Only include courses with at least one matching tag
-                    recommended_courses.append((course["_id"], score))
+            # Simplified prompt with clearer instructions
+            prompt = f"""
+            You are a course recommendation system. Match user interests with course tags to find relevant courses.
             
-            # Sort by relevance score (descending)
-            recommended_courses.sort(key=lambda x: x[1], reverse=True)
+            User Interests: {json.dumps(user_interests)}
             
-            # Create our own recommendation response
-            groq_data = {
-                "recommendedItems": [course_id for course_id, _ in recommended_courses]
-            }
+            Available Courses: {prompt_budget.dumps(courses_data)}
+            
+            Return a JSON object with this exact format:
+            {{
+                "recommendedItems": [
+                    "course_id_1", 
+                    "course_id_2"
+                ]
+            }}
+            
+            Include only course IDs in the recommendedItems array, sorted by relevance.
+            """
+
+            # Create a completion request with fallback mechanism
+            try:
+                message_content = llm_gateway.chat(
+                    "course_recommendations",
+                    validate=llm_gateway.has_list("recommendedItems"),
+                    model="deepseek-r1-distill-llama-70b",
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.1,  # Lower temperature for more deterministic output
+                    max_tokens=500,
+                    top_p=1,
+                    stream=False,
+                    response_format={"type": "json_object"},
+                    stop=None
+                )
+
+                # Parse the response
+                groq_data = json.loads(message_content)
+                if not isinstance(groq_data.get("recommendedItems"), list):
+                    raise ValueError("Response has no recommendedItems list")
+            
+            except Exception as api_error:
+                # Fallback to the local tag ranker if AI fails
+                metrics.record_error(api_error)
+                print(f"AI recommendation failed: {str(api_error)}. Using fallback method.")
+                groq_data = {"recommendedItems": ranker.rank(user_interests)}
         
         # Check if we have recommendations (either from AI or fallback)
         if not groq_data or 'recommendedItems' not in groq_data:
@@ -491,6 +1118,7 @@ def get_course_recommendations():
         return jsonify({"success": True, "courses": all_sorted_courses}), 200
     
     except Exception as e:
+        metrics.record_error(e)
         print(f"Error in course recommendation: {str(e)}")
         return jsonify({
             "success": False, 
@@ -506,19 +1134,70 @@ def generate_module_suggestions():
     if not data or 'modules' not in data or 'performance' not in data:
         return jsonify({"error": "Missing required fields in the request."}), 400
     
-    modules = data['modules']
     performance = data['performance']
-    print("performance ",performance)
-    student_id = data.get('student_id', 'unknown')
     course_id = data.get('course_id', 'unknown')
-    
+    if not isinstance(performance, (int, float)) or not isinstance(data['modules'], list):
+        return jsonify({"error": "Expected 'modules', a list, and 'performance', a number."}), 400
+
+    # Suggestions are cached per module and performance band, so only
+    # modules without them go to the model
+    modules = list(dict.fromkeys(str(module) for module in data['modules']))
+    performance_band = suggestion_band(performance)
+    suggestions = suggestion_cache.get_many(course_id, modules, performance_band)
+    missing = [module for module in modules if module not in suggestions]
+
+    if missing:
+        try:
+            generated = generate_suggestions_batched(missing, performance_band, course_id)
+        except StructuredOutputError as e:
+            metrics.record_error(e)
+            return jsonify({"error": "Response from AI model is not valid JSON."}), 500
+        suggestions.update(generated)
+
+    return jsonify({"suggestions": {module: suggestions[module] for module in modules if module in suggestions}})
+
+# Suggestions for every missing module, generated in concurrent batches
+# sized to the prompt budget and reply length, and cached as each batch
+# arrives. Modules a reply left out are asked for once more. Raises the
+# first batch error, after caching the batches that succeeded.
+def generate_suggestions_batched(modules, performance_band, course_id):
+    generated = {}
+    for _ in range(2):
+        pending = [module for module in modules if module not in generated]
+        if not pending:
+            break
+        batches = prompt_budget.batch_items(
+            "module_suggestions", "llama-3.1-8b-instant", pending, serialize=str,
+            max_tokens=1000, max_items=MODULE_SUGGESTION_BATCH,
+        )
+        futures = scheduler.submit_bounded(
+            suggestion_executor,
+            lambda batch: generate_missing_suggestions(batch, performance_band, course_id),
+            batches,
+            MODULE_SUGGESTION_CONCURRENCY,
+        )
+        error = None
+        for batch, future in zip(batches, futures):
+            try:
+                batch_suggestions = match_modules(batch, future.result().get('suggestions', {}))
+            except Exception as e:
+                error = error or e
+                continue
+            suggestion_cache.put_many(course_id, batch_suggestions, performance_band)
+            generated.update(batch_suggestions)
+        if error is not None:
+            raise error
+    return generated
+
+# Suggestions for modules at a performance band. Raises StructuredOutputError.
+def generate_missing_suggestions(modules, performance_band, course_id):
+    low, high = suggestion_band_range(performance_band)
     # Create a prompt for generating personalized suggestions
     prompt = f"""
     You are an educational AI assistant. Based on the following information, generate three personalized learning suggestions for each module to help the student improve.
 
-    Student Performance: {performance * 100:.2f}% overall
+    Student Performance: between {low}% and {high}% overall
     Course ID: {course_id}
-    Student ID: {student_id}
     
     Modules:
     {", ".join(modules)}
@@ -546,7 +1225,8 @@ def generate_module_suggestions():
     """
     
     # Create a completion request to generate module suggestions
-    completion = client.chat.completions.create(
+    return structured_output.generate(
+        "module_suggestions",
         model="llama-3.1-8b-instant",  # You can use other Groq models as needed
         messages=[
             {
@@ -555,20 +1235,12 @@ def generate_module_suggestions():
             }
         ],
         temperature=0.7,  # Slightly higher temperature for creative suggestions
-        max_tokens=1000,  # Allow longer responses for multiple modules
+        max_tokens=100 + 150 * len(modules),  # About 150 tokens per module
         top_p=1,
         stream=False,
         response_format={"type": "json_object"},
         stop=None,
     )
-    message_content = completion.choices[0].message.content
-    
-    # If the content is in JSON format, parse it
-    try:
-        json_response = json.loads(message_content)
-        return jsonify(json_response)
-    except json.JSONDecodeError:
-        return jsonify({"error": "Response from AI model is not valid JSON."}), 500
 
 @app.route('/find-similar-courses', methods=['POST'])
 def find_similar_courses():
@@ -581,8 +1253,39 @@ def find_similar_courses():
         
         course_title = data['courseTitle']
         course_description = data['courseDescription']
+
+        # Index the course and look up its nearest indexed neighbours
+        index = get_similarity_index()
+        key = course_key(data.get('courseId'), course_title, course_description)
+        vector = index.vector_for(key, course_title, course_description)
+        neighbours = index.query(vector, k=SIMILAR_COURSES_K, exclude=key)
+        related_courses = [
+            {"courseId": neighbour_key, "title": title, "score": round(score, 3)}
+            for neighbour_key, title, score in neighbours
+            if not neighbour_key.startswith("text:")
+        ]
+
+        # Serve cached results for this course, or borrow a near-duplicate's
+        similar_courses = index.get_results(key)
+        if similar_courses is None:
+            for neighbour_key, _, score in neighbours:
+                if score < SIMILARITY_REUSE_THRESHOLD:
+                    break
+                similar_courses = index.get_results(neighbour_key)
+                if similar_courses is not None:
+                    index.set_results(key, similar_courses)
+                    break
+        if similar_courses is not None:
+            return jsonify({
+                "success": True,
+                "similarCourses": similar_courses,
+                "relatedCourses": related_courses
+            }), 200
         
-        # Prepare prompt for the LLM to search for similar courses
+        # Cold entry: prepare prompt for the LLM to search for similar courses
+        course_description = prompt_budget.fit_text(
+            "find_similar_courses", "llama-3.1-8b-instant", course_description, max_tokens=1000
+        )
         prompt = f"""
         You are a course recommendation assistant. Find similar courses to the one described below from platforms like Khan Academy, Coursera, and YouTube.
 
@@ -615,7 +1318,9 @@ def find_similar_courses():
         """
 
         # Create a completion request
-        completion = client.chat.completions.create(
+        message_content = llm_gateway.chat(
+            "find_similar_courses",
+            validate=llm_gateway.has_list("similarCourses"),
             model="llama-3.1-8b-instant",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3,
@@ -625,17 +1330,23 @@ def find_similar_courses():
             response_format={"type": "json_object"},
             stop=None
         )
-        message_content = completion.choices[0].message.content
 
         # Parse the response
         json_response = json.loads(message_content)
+        similar_courses = json_response.get("similarCourses", [])
+        if similar_courses:
+            index.set_results(key, similar_courses)
         
         return jsonify({
             "success": True, 
-            "similarCourses": json_response.get("similarCourses", [])
+            "similarCourses": similar_courses,
+            "relatedCourses": related_courses
         }), 200
     
+    except LLMUnavailableError:
+        raise  # Answered 503 by the error handler
     except Exception as e:
+        metrics.record_error(e)
         print(f"Error finding similar courses: {str(e)}")
         return jsonify({
             "success": False, 
@@ -643,5 +1354,46 @@ def find_similar_courses():
             "details": str(e)
         }), 500
 
+@app.route('/courses/index', methods=['POST'])
+def index_courses():
+    data = request.get_json()
+
+    # Check if required data is provided
+    courses = data.get('courses') if data else None
+    if not isinstance(courses, list) or not all(isinstance(course, dict) and course.get('_id') for course in courses):
+        return jsonify({"success": False, "error": "Expected 'courses', a list of objects with '_id'"}), 400
+
+    # Add or update courses incrementally; unchanged ones are skipped
+    index = get_similarity_index()
+    index.add_many(
+        (str(course['_id']), course.get('title', ''), course.get('description', ''))
+        for course in courses
+    )
+    return jsonify({"success": True, "indexed": len(courses), "total": len(index)}), 200
+
+@app.route('/courses/<course_id>/similar', methods=['GET'])
+def get_similar_indexed_courses(course_id):
+    index = get_similarity_index()
+    vector = index.vector(course_id)
+    if vector is None:
+        return jsonify({"success": False, "error": "Course is not indexed"}), 404
+
+    k = request.args.get('k', SIMILAR_COURSES_K, type=int)
+    neighbours = index.query(vector, k=k, exclude=course_id)
+    return jsonify({
+        "success": True,
+        "relatedCourses": [
+            {"courseId": neighbour_key, "title": title, "score": round(score, 3)}
+            for neighbour_key, title, score in neighbours
+            if not neighbour_key.startswith("text:")
+        ]
+    }), 200
+
+# Long running endpoints that can also run as background jobs
+jobs.register("grade", grade_submission)
+jobs.register("roadmap", generate_roadmap)
+# Workers start, and resume jobs left from a previous run, with the first request
+app.before_request(jobs.ensure_started)
+
 if __name__ == '__main__':
     app.run(debug=True)
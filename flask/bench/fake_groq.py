@@ -0,0 +1,276 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from pdfgen import make_pdf
+
+# Local stand-in for the Groq chat completions API, so the app can be load
+# tested without spending quota. Point the app at it with
+# GROQ_BASE_URL=http://127.0.0.1:8000. It also serves synthetic PDFs at
+# /pdf/<pages>.pdf for /grade, with an ETag so conditional GETs work.
+
+CHARS_PER_TOKEN = 4
+
+config = {
+    "latency": 0.3,  # Seconds before the first token
+    "jitter": 0.1,  # Uniform extra latency, up to this many seconds
+    "tokens_per_second": 500.0,  # Generation speed after the first token
+    "error_rate": 0.0,  # Fraction of calls answered with an error status
+    "error_statuses": [503],
+}
+stats = {"calls": 0, "errors": 0, "streams": 0, "pdfs": 0}
+_stats_lock = threading.Lock()
+_pdf_cache = {}
+
+
+def _count(name):
+    with _stats_lock:
+        stats[name] += 1
+
+
+def _tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _question(n):
+    return {
+        "question": f"Sample question {n}?",
+        "options": {"a": "Option A", "b": "Option B", "c": "Option C", "d": "Option D"},
+        "answer": "a",
+    }
+
+
+def _module(order):
+    return {
+        "title": f"Module {order}",
+        "description": "Module description.",
+        "order": order,
+        "contents": [
+            {
+                "type": "video",
+                "title": f"Content {order}.{i}",
+                "description": "Description of content.",
+                "resource": {"url": "", "duration": 0, "publicId": ""},
+                "tags": ["tag1", "tag2"],
+            }
+            for i in range(1, 3)
+        ],
+        "quiz": {
+            "questions": [dict(_question(i), conceptTags=["concept1"], difficulty=1) for i in range(1, 3)],
+            "passingScore": 70,
+        },
+    }
+
+
+# A plausible answer for the prompt, recognised by phrases from the app's prompts
+def fake_answer(prompt):
+    if "grading assistant. Grade" in prompt:
+        answer = {"grade": random.randint(5, 9)}
+        for criterion in re.findall(r'"([^"]+)": "Description for criterion', prompt):
+            answer[criterion] = f"Adequate work on {criterion}."
+        return answer
+    if "multiple-choice questions" in prompt:
+        return {"quiz": [_question(n) for n in range(1, 6)]}
+    if "Provide feedback" in prompt:
+        return {"feedback": "Good attempt. Review the material on this topic and try again."}
+    if "outline of a course roadmap" in prompt:
+        return {"modules": [{"title": f"Module {order}", "description": "Module description."} for order in range(1, 5)]}
+    if "one module of a course roadmap" in prompt:
+        match = re.search(r"Module (\d+) of", prompt)
+        return _module(int(match.group(1)) if match else 1)
+    if "course roadmap" in prompt:
+        return {"modules": [_module(order) for order in range(1, 5)]}
+    if "tag assignment assistant" in prompt:
+        return {"interests": ["Programming", "Data Science", "Mathematics"]}
+    if "course recommendation system" in prompt:
+        match = re.search(r"Available Courses: (\[.*?\])\s*\n", prompt, re.S)
+        courses = json.loads(match.group(1)) if match else []
+        ids = [course["id"] for course in courses]
+        random.shuffle(ids)
+        return {"recommendedItems": ids}
+    if "learning suggestions" in prompt:
+        match = re.search(r"Modules:\s*\n\s*(.*)\n", prompt)
+        modules = [m.strip() for m in match.group(1).split(",")] if match else []
+        return {"suggestions": {m: [f"Suggestion {i} for {m}" for i in range(1, 4)] for m in modules}}
+    if "similarCourses" in prompt:
+        return {
+            "similarCourses": [
+                {
+                    "title": f"Similar course {i}",
+                    "platform": "Coursera",
+                    "url": f"https://www.coursera.org/learn/similar-course-{i}",
+                    "relevance": "Covers the same topics.",
+                }
+                for i in range(1, 6)
+            ]
+        }
+    return {"result": "ok"}
+
+
+def _sleep_for(completion_tokens):
+    time.sleep(config["latency"] + random.uniform(0, config["jitter"]))
+    return completion_tokens / config["tokens_per_second"]
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        match = re.fullmatch(r"/pdf/(\d+)\.pdf", url.path)
+        if url.path == "/stats":
+            self._send_json(200, stats)
+        elif match:
+            self._send_pdf(int(match.group(1)), parse_qs(url.query))
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    # The query string (e.g. ?n=17) picks a distinct document, so a driver
+    # can defeat the app's PDF cache by varying it
+    def _send_pdf(self, pages, query):
+        key = (pages, self.path)
+        if key not in _pdf_cache:
+            seed = int(hashlib.sha1(self.path.encode()).hexdigest()[:8], 16)
+            _pdf_cache[key] = make_pdf(pages, seed=seed)
+        body = _pdf_cache[key]
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        _count("pdfs")
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/openai/v1/chat/completions":
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        _count("calls")
+
+        if random.random() < config["error_rate"]:
+            _count("errors")
+            time.sleep(config["latency"])
+            status = random.choice(config["error_statuses"])
+            headers = {"Retry-After": "1"} if status == 429 else None
+            self._send_json(status, {"error": {"message": "Injected failure", "type": "fake_error"}}, headers)
+            return
+
+        prompt = "\n".join(str(message.get("content", "")) for message in request.get("messages", []))
+        content = json.dumps(fake_answer(prompt))
+        usage = {
+            "prompt_tokens": _tokens(prompt),
+            "completion_tokens": _tokens(content),
+            "total_tokens": _tokens(prompt) + _tokens(content),
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = request.get("model", "fake")
+
+        if request.get("stream"):
+            self._stream(completion_id, model, content, usage)
+            return
+
+        time.sleep(_sleep_for(usage["completion_tokens"]))
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    # Server-sent chunks at the configured token rate, with usage on the last
+    # chunk under x_groq like the real API
+    def _stream(self, completion_id, model, content, usage):
+        _count("streams")
+        seconds_per_token = _sleep_for(usage["completion_tokens"]) / usage["completion_tokens"]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(data):
+            frame = f"data: {data}\n\n".encode()
+            self.wfile.write(b"%x\r\n" % len(frame) + frame + b"\r\n")
+            self.wfile.flush()
+
+        step = CHARS_PER_TOKEN * 4
+        for start in range(0, len(content), step):
+            send(json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[start:start + step]}, "finish_reason": None}],
+            }))
+            time.sleep(seconds_per_token * 4)
+        send(json.dumps({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"id": completion_id, "usage": usage},
+        }))
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Groq chat completions server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=config["latency"], help="seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=config["jitter"], help="uniform extra latency in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=config["tokens_per_second"])
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"], help="fraction of calls that fail")
+    parser.add_argument("--error-statuses", default="503", help="comma-separated statuses for injected failures")
+    args = parser.parse_args()
+
+    config.update(
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_statuses=[int(status) for status in args.error_statuses.split(",")],
+    )
+    server = ThreadingHTTPServer((args.host, args.port), FakeGroqHandler)
+    server.daemon_threads = True
+    print(f"Fake Groq listening on http://{args.host}:{args.port} with {config}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import argparse
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Load driver for the Flask app. Typical run against the fake Groq server:
+#
+#   python bench/fake_groq.py --latency 0.5 &
+#   GROQ_BASE_URL=http://127.0.0.1:8000 GROQ_API_KEY=bench python app.py &
+#   python bench/loadtest.py --concurrency 1,8,32 --requests 200
+#
+# Each scenario is run at every concurrency level and reported as p50/p95/p99
+# latency, time to first byte and requests per second. Payloads differ per
+# request unless --repeat is given, so caches only help when asked to.
+
+TAGS = ["Programming", "Data Science", "Web Development", "Mathematics", "Finance", "History"]
+
+
+def _courses(count, n):
+    return [
+        {
+            "_id": f"course-{i}",
+            "title": f"Course {i}",
+            "description": f"Course {i}, edition {n}, about {TAGS[i % len(TAGS)]} and {TAGS[(i * 7) % len(TAGS)]}",
+            "tags": [TAGS[i % len(TAGS)], TAGS[(i * 7) % len(TAGS)]],
+        }
+        for i in range(count)
+    ]
+
+
+def _question(n):
+    return {
+        "question": f"What is {n} + 1?",
+        "options": {"a": str(n + 1), "b": str(n), "c": str(n + 2), "d": "0"},
+        "answer": "a",
+        "user_answer": "b",
+    }
+
+
+# name -> function(n, options) returning (method, path, json body, headers)
+SCENARIOS = {
+    "grade": lambda n, o: (
+        "POST", "/grade",
+        {"pdf_url": o.pdf_url(n), "criteria": ["clarity", "accuracy", "structure"]}, None,
+    ),
+    "grade_async": lambda n, o: (
+        "POST", "/grade",
+        {"pdf_url": o.pdf_url(n), "criteria": ["clarity", "accuracy"], "async": True}, None,
+    ),
+    "grade_batch": lambda n, o: (
+        "POST", "/grade/batch",
+        {"items": [{"pdf_url": o.pdf_url(n * 10 + i), "criteria": ["clarity"]} for i in range(5)]}, None,
+    ),
+    "quiz": lambda n, o: ("POST", "/quiz", {"description": f"Intro to algebra, lesson {o.vary(n)}"}, None),
+    "quiz_feedback": lambda n, o: (
+        "POST", "/quiz/feedback", {"questions": [_question(o.vary(n) * 5 + i) for i in range(5)]}, None,
+    ),
+    "roadmap": lambda n, o: ("POST", "/roadmap", {"description": f"Learn Python, track {o.vary(n)}"}, None),
+    "roadmap_stream": lambda n, o: (
+        "POST", "/roadmap", {"description": f"Learn Python, track {o.vary(n)}", "stream": True},
+        {"Accept": "text/event-stream"},
+    ),
+    "assign_tags": lambda n, o: (
+        "POST", "/assign-student-tags", {"about": f"I enjoy coding in python and statistics ({o.vary(n)})"}, None,
+    ),
+    "assign_tags_vague": lambda n, o: (
+        "POST", "/assign-student-tags", {"about": f"I like lots of stuff, number {o.vary(n)}"}, None,
+    ),
+    "assign_tags_bulk": lambda n, o: (
+        "POST", "/assign-student-tags/bulk",
+        {"profiles": [f"Student {o.vary(n)}-{i} loves web development and design" for i in range(20)]}, None,
+    ),
+    "course_recommendations": lambda n, o: (
+        "POST", "/courses/recommendations",
+        {"userInterests": TAGS[: 1 + o.vary(n) % 3], "courses": _courses(o.catalog_size, o.vary(n))}, None,
+    ),
+    "module_suggestions": lambda n, o: (
+        "POST", "/generate-module-suggestions",
+        {"modules": ["Variables", "Loops", "Functions"], "performance": 0.5 + (o.vary(n) % 50) / 100,
+         "student_id": f"s{o.vary(n)}", "course_id": "c1"}, None,
+    ),
+    "find_similar_courses": lambda n, o: (
+        "POST", "/find-similar-courses",
+        {"courseTitle": f"Intro to Python {o.vary(n)}", "courseDescription": "Learn python programming basics"}, None,
+    ),
+    "courses_index": lambda n, o: ("POST", "/courses/index", {"courses": _courses(o.catalog_size, o.vary(n))}, None),
+    "similar_indexed": lambda n, o: ("GET", f"/courses/course-{n % max(o.catalog_size, 1)}/similar", None, None),
+    "metrics": lambda n, o: ("GET", "/metrics", None, None),
+    "healthz": lambda n, o: ("GET", "/healthz", None, None),
+}
+
+
+class Options:
+    def __init__(self, args):
+        self.fake = args.fake.rstrip("/")
+        self.pages = args.pages
+        self.repeat = args.repeat
+        self.catalog_size = args.catalog_size
+
+    # The request number, or 0 for every request when --repeat asks for identical payloads
+    def vary(self, n):
+        return 0 if self.repeat else n
+
+    def pdf_url(self, n):
+        return f"{self.fake}/pdf/{self.pages}.pdf?n={self.vary(n)}"
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+_sessions = threading.local()
+
+
+def _session():
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    return session
+
+
+# One request: (latency, time to first byte, ok). Streamed bodies are read to the end.
+def send(target, scenario, n, options, timeout):
+    method, path, body, headers = SCENARIOS[scenario](n, options)
+    start = time.perf_counter()
+    first_byte = None
+    try:
+        response = _session().request(method, target + path, json=body, headers=headers, stream=True, timeout=timeout)
+        for chunk in response.iter_content(chunk_size=None):
+            if first_byte is None and chunk:
+                first_byte = time.perf_counter() - start
+        ok = response.status_code < 400
+    except requests.exceptions.RequestException:
+        ok = False
+    latency = time.perf_counter() - start
+    return latency, first_byte if first_byte is not None else latency, ok
+
+
+# Request numbers are unique across the whole run, and start from the clock so
+# separate runs against the same app do not hit each other's cached responses
+_request_numbers = itertools.count(int(time.time() * 1000) % 10 ** 9)
+
+
+def run_level(target, scenario, concurrency, total, options, timeout):
+    remaining = itertools.count()
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            if next(remaining) >= total:
+                return
+            result = send(target, scenario, next(_request_numbers), options, timeout)
+            with lock:
+                results.append(result)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _, _ in results]
+    first_bytes = [first_byte for _, first_byte, _ in results]
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": sum(1 for _, _, ok in results if not ok),
+        "rps": len(results) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "ttfb_p50": percentile(first_bytes, 0.50),
+    }
+
+
+def print_row(row):
+    print(
+        f"{row['scenario']:<24}{row['concurrency']:>6}{row['requests']:>8}{row['errors']:>8}"
+        f"{row['rps']:>10.1f}{row['p50'] * 1000:>10.1f}{row['p95'] * 1000:>10.1f}"
+        f"{row['p99'] * 1000:>10.1f}{row['ttfb_p50'] * 1000:>10.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and throughput benchmark for the EduSync Flask API")
+    parser.add_argument("--target", default="http://127.0.0.1:5000", help="base URL of the app")
+    parser.add_argument("--fake", default="http://127.0.0.1:8000", help="base URL of bench/fake_groq.py, for PDFs")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario and level")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured requests before each scenario")
+    parser.add_argument("--pages", type=int, default=5, help="pages per synthetic PDF")
+    parser.add_argument("--catalog-size", type=int, default=200, help="courses sent to the catalog routes")
+    parser.add_argument("--repeat", action="store_true", help="send identical payloads so caches can hit")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    options = Options(args)
+    target = args.target.rstrip("/")
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    print(f"{'scenario':<24}{'conc':>6}{'reqs':>8}{'errors':>8}{'rps':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttfb ms':>10}")
+    rows = []
+    for scenario in scenarios:
+        for _ in range(args.warmup):
+            send(target, scenario, next(_request_numbers), options, args.timeout)
+        for concurrency in levels:
+            row = run_level(target, scenario, concurrency, args.requests, options, args.timeout)
+            print_row(row)
+            rows.append(row)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
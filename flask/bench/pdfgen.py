@@ -0,0 +1,65 @@
+import argparse
+import random
+
+# A small vocabulary so extracted text looks like prose, not one repeated token
+WORDS = (
+    "analysis method result data model system student course learning design process value "
+    "function network theory practice example problem solution research report evidence test "
+    "structure approach review figure table section summary performance question answer"
+).split()
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+# Build a valid text-only PDF with `pages` pages of `lines` lines each,
+# without any PDF library. The same seed always gives the same bytes.
+def make_pdf(pages, lines=40, words_per_line=12, seed=0):
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for page in range(pages):
+        text_lines = [f"Page {page + 1}"] + [
+            " ".join(rng.choice(WORDS) for _ in range(words_per_line)) for _ in range(lines)
+        ]
+        operations = ["BT", "/F1 10 Tf", "12 TL", "40 760 Td"]
+        operations += [f"({_escape(line)}) Tj T*" for line in text_lines]
+        operations.append("ET")
+        stream = "\n".join(operations).encode()
+
+        page_number = len(objects) + 1
+        kids.append(f"{page_number} 0 R")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_number + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic PDF for /grade benchmarks")
+    parser.add_argument("output")
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--lines", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with open(args.output, "wb") as f:
+        f.write(make_pdf(args.pages, args.lines, seed=args.seed))
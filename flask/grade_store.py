@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import metrics
+import storage
+
+# Keep every grade and answer repeats of a request from the store
+GRADE_STORE_ENABLED = os.getenv("GRADE_STORE_ENABLED", "1") == "1"
+# A grade claimed by a process that died is taken over after this long
+GRADE_STORE_LEASE = float(os.getenv("GRADE_STORE_LEASE", "600"))
+# How often a waiting request checks on a grade running in another process
+GRADE_STORE_POLL = float(os.getenv("GRADE_STORE_POLL", "0.5"))
+# Rows returned per page by query()
+GRADE_STORE_PAGE_MAX = 1000
+
+grade_store_total = metrics.Counter(
+    "edusync_grade_store_total", "Grade store lookups by outcome (stored, waited, graded)", ("kind", "result")
+)
+
+
+# Key for a submission's text graded against criteria in a mode
+def content_key(text, criteria, mode):
+    digest = hashlib.sha256()
+    digest.update(text.encode())
+    digest.update(b"\0" + json.dumps(criteria, sort_keys=True).encode())
+    digest.update(b"\0" + str(mode).encode())
+    return "content:" + digest.hexdigest()
+
+
+def idempotency_key(key):
+    return "idempotency:" + key
+
+
+# Grades in SQLite, by idempotency key and by content. A key is claimed by
+# the first request that needs it; requests arriving while it runs wait for
+# its result, and later ones get the stored result without grading again.
+# Only successful grades are stored, so a failed one is graded again.
+# A grading is stored once, as its content row: an idempotency row only
+# points at that row (ref), and grade_urls has every PDF URL that produced it.
+class GradeStore:
+    def __init__(self, db_name="grades.db"):
+        self.db_name = db_name
+        self._events = {}  # key -> Event set when this process finishes it
+        self._lock = threading.Lock()
+        with storage.connect(self.db_name) as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS grades (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    pdf_url TEXT,
+                    criteria TEXT,
+                    result TEXT,
+                    status_code INTEGER,
+                    ref TEXT,
+                    lease_until REAL NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS grade_urls (
+                    key TEXT NOT NULL,
+                    pdf_url TEXT NOT NULL,
+                    PRIMARY KEY (key, pdf_url)
+                )
+                """
+            )
+            # Stores created before ref existed: add it and index their URLs
+            if "ref" not in [row["name"] for row in conn.execute("PRAGMA table_info(grades)")]:
+                conn.execute("ALTER TABLE grades ADD COLUMN ref TEXT")
+                conn.execute(
+                    "INSERT OR IGNORE INTO grade_urls (key, pdf_url) "
+                    "SELECT key, pdf_url FROM grades WHERE kind = 'content' AND pdf_url IS NOT NULL"
+                )
+            conn.execute("CREATE INDEX IF NOT EXISTS grades_updated ON grades (status, updated_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS grade_urls_pdf_url ON grade_urls (pdf_url)")
+
+    # ("done", (body, status_code)), ("claimed", None) or ("running", None)
+    def _claim(self, key, pdf_url, criteria):
+        now = time.time()
+        with storage.connect(self.db_name) as conn:
+            # Take the write lock first so two processes cannot both claim the key
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """
+                SELECT g.status, COALESCE(c.result, g.result) AS result,
+                    COALESCE(c.status_code, g.status_code) AS status_code, g.lease_until
+                FROM grades g LEFT JOIN grades c ON c.key = g.ref WHERE g.key = ?
+                """,
+                (key,),
+            ).fetchone()
+            if row is not None and row["status"] == "done":
+                return "done", (json.loads(row["result"]), row["status_code"])
+            if row is not None and row["lease_until"] > now:
+                return "running", None
+            conn.execute(
+                """
+                INSERT INTO grades (key, kind, status, pdf_url, criteria, lease_until, created_at, updated_at)
+                VALUES (?, ?, 'running', ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET status = 'running', lease_until = excluded.lease_until,
+                    updated_at = excluded.updated_at
+                """,
+                (key, key.split(":", 1)[0], pdf_url, json.dumps(criteria), now + GRADE_STORE_LEASE, now, now),
+            )
+        with self._lock:
+            self._events[key] = threading.Event()
+        return "claimed", None
+
+    def _finish(self, key, result):
+        with storage.connect(self.db_name) as conn:
+            if result is None:
+                conn.execute("DELETE FROM grades WHERE key = ? AND status = 'running'", (key,))
+            else:
+                # A row pointing at a content row keeps no copy of its result
+                body, status_code = result
+                conn.execute(
+                    """
+                    UPDATE grades SET status = 'done', result = CASE WHEN ref IS NULL THEN ? END,
+                        status_code = ?, lease_until = 0, updated_at = ? WHERE key = ?
+                    """,
+                    (json.dumps(body), status_code, time.time(), key),
+                )
+        with self._lock:
+            event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
+
+    # Record that pdf_url produced the grade stored under key, and point the
+    # row of the request being answered (parent) at it
+    def _link(self, key, pdf_url, parent):
+        with storage.connect(self.db_name) as conn:
+            if pdf_url:
+                conn.execute("INSERT OR IGNORE INTO grade_urls (key, pdf_url) VALUES (?, ?)", (key, pdf_url))
+            if parent:
+                conn.execute("UPDATE grades SET ref = ? WHERE key = ?", (key, parent))
+
+    # (body, status_code) for key: stored, waited for, or computed by
+    # compute() and stored when it is a successful grade. parent is the key
+    # of an enclosing run() that this grade answers.
+    def run(self, key, compute, pdf_url=None, criteria=None, parent=None):
+        kind = key.split(":", 1)[0]
+        waited = False
+        while True:
+            state, result = self._claim(key, pdf_url, criteria)
+            if state == "done":
+                self._link(key, pdf_url, parent)
+                grade_store_total.inc(kind=kind, result="waited" if waited else "stored")
+                return result
+            if state == "claimed":
+                break
+            # Running elsewhere: wait for it, or for its lease to run out
+            waited = True
+            with self._lock:
+                event = self._events.get(key)
+            if event is not None:
+                event.wait(GRADE_STORE_LEASE)
+            else:
+                time.sleep(GRADE_STORE_POLL)
+
+        stored = None
+        try:
+            body, status_code = compute()
+            if isinstance(body, dict) and status_code < 400:
+                stored = (body, status_code)
+                self._link(key, pdf_url, parent)
+            return body, status_code
+        finally:
+            self._finish(key, stored)
+            grade_store_total.inc(kind=kind, result="graded")
+
+    # Stored grades for reporting, oldest first, one per grading. Filters
+    # are optional; keys lists the gradings answering those idempotency keys
+    # and after is the "next" cursor of the previous page.
+    def query(self, pdf_urls=None, keys=None, since=None, after=None, limit=100):
+        clauses = ["g.status = 'done'"]
+        params = []
+        if keys:
+            clauses.append(f"g.key IN ({','.join('?' * len(keys))})")
+            params += [idempotency_key(key) for key in keys]
+        else:
+            clauses.append("g.kind = 'content'")
+        if pdf_urls:
+            clauses.append(
+                f"COALESCE(g.ref, g.key) IN (SELECT key FROM grade_urls WHERE pdf_url IN ({','.join('?' * len(pdf_urls))}))"
+            )
+            params += list(pdf_urls)
+        if since is not None:
+            clauses.append("g.updated_at >= ?")
+            params.append(since)
+        if after is not None:
+            clauses.append("g.rowid > ?")
+            params.append(after)
+        limit = max(1, min(int(limit), GRADE_STORE_PAGE_MAX))
+        with storage.connect(self.db_name) as conn:
+            rows = conn.execute(
+                f"""
+                SELECT g.rowid, g.key, g.kind, g.pdf_url, g.criteria, g.updated_at,
+                    COALESCE(g.ref, g.key) AS grade_key, COALESCE(c.result, g.result) AS result,
+                    COALESCE(c.status_code, g.status_code) AS status_code
+                FROM grades g LEFT JOIN grades c ON c.key = g.ref
+                WHERE {' AND '.join(clauses)} ORDER BY g.rowid LIMIT ?
+                """,
+                params + [limit],
+            ).fetchall()
+            urls = {}
+            grade_keys = list({row["grade_key"] for row in rows})
+            if grade_keys:
+                for url in conn.execute(
+                    f"SELECT key, pdf_url FROM grade_urls WHERE key IN ({','.join('?' * len(grade_keys))}) ORDER BY rowid",
+                    grade_keys,
+                ):
+                    urls.setdefault(url["key"], []).append(url["pdf_url"])
+        grades = [
+            {
+                "key": row["key"].split(":", 1)[1],
+                "kind": row["kind"],
+                "pdf_url": row["pdf_url"],
+                "pdf_urls": urls.get(row["grade_key"], [row["pdf_url"]] if row["pdf_url"] else []),
+                "criteria": json.loads(row["criteria"]) if row["criteria"] else None,
+                "result": json.loads(row["result"]),
+                "status_code": row["status_code"],
+                "graded_at": row["updated_at"],
+            }
+            for row in rows
+        ]
+        return grades, (rows[-1]["rowid"] if len(rows) == limit else None)
+
+
+grade_store = GradeStore()
@@ -0,0 +1,62 @@
+import os
+import textwrap
+
+from prompt_budget import count_tokens
+
+# Documents counted above this many tokens are graded in chunks
+GRADE_CHUNK_TOKENS = int(os.getenv("GRADE_CHUNK_TOKENS", "3000"))
+
+
+# Split text into chunks of about max_tokens, breaking on line (page) boundaries
+# and only splitting a single line on whitespace when it is too long by itself.
+# Tokens are counted like the prompt budgets count them.
+def chunk_text(text, max_tokens=GRADE_CHUNK_TOKENS):
+    chunks = []
+    current = []
+    current_size = 0
+
+    def flush():
+        nonlocal current, current_size
+        if current:
+            chunks.append("\n".join(current))
+        current = []
+        current_size = 0
+
+    for line in text.split("\n"):
+        # A piece never costs more tokens than it has characters
+        pieces = textwrap.wrap(line, max_tokens) if count_tokens(line) > max_tokens else [line]
+        for piece in pieces:
+            tokens = count_tokens(piece) + 1
+            if current_size + tokens > max_tokens:
+                flush()
+            current.append(piece)
+            current_size += tokens
+    flush()
+    return [chunk for chunk in chunks if chunk.strip()] or [text]
+
+
+def _as_grade(value):
+    try:
+        return min(10.0, max(1.0, float(value)))
+    except (TypeError, ValueError):
+        return None
+
+
+# Combine per-chunk results into the single-call {"grade": ..., <criterion>: ...}
+# shape. The grade is the mean of the chunk grades weighted by chunk length;
+# each criterion keeps the description from the largest chunk that has one.
+def reduce_grades(partials, weights, criteria):
+    graded = [(_as_grade(p.get("grade")), w) for p, w in zip(partials, weights)]
+    graded = [(g, w) for g, w in graded if g is not None]
+    if not graded:
+        return None
+
+    total_weight = sum(w for _, w in graded)
+    result = {"grade": round(sum(g * w for g, w in graded) / total_weight)}
+    by_weight = sorted(zip(partials, weights), key=lambda pair: pair[1], reverse=True)
+    for criterion in criteria:
+        for partial, _ in by_weight:
+            if partial.get(criterion):
+                result[criterion] = partial[criterion]
+                break
+    return result
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import storage
+from lru import LRUCache
+
+# Seconds a cached completion stays valid, per endpoint. Endpoints that are
+# not listed (or set to 0) are never cached, e.g. the temperature=1 /quiz.
+DEFAULT_TTLS = {
+    "roadmap": 24 * 3600,
+    "course_recommendations": 3600,
+    "find_similar_courses": 24 * 3600,
+}
+# Memory bound for cached completion text
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Also keep cached completions in SQLite so they survive restarts
+LLM_CACHE_PERSIST = os.getenv("LLM_CACHE_PERSIST", "0") == "1"
+
+
+# Parse "roadmap=3600,quiz=0" overrides on top of the defaults
+def _load_ttls():
+    ttls = dict(DEFAULT_TTLS)
+    for item in os.getenv("LLM_CACHE_TTLS", "").split(","):
+        if "=" in item:
+            endpoint, seconds = item.split("=", 1)
+            ttls[endpoint.strip()] = float(seconds)
+    return ttls
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class ResponseCache:
+    def __init__(self, ttls, max_bytes, persist=False):
+        self.ttls = ttls
+        self.persist = persist
+        self._memory = LRUCache(max_bytes, sizeof=len)
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self.stats = {}  # endpoint -> {"hits": n, "misses": n}
+
+    def enabled(self, endpoint):
+        return self.ttls.get(endpoint, 0) > 0
+
+    # Key on the whitespace-normalized prompt, the model and every sampling parameter
+    def make_key(self, model, messages, **params):
+        payload = {
+            "model": model,
+            "messages": [{"role": m["role"], "content": _normalize(m["content"])} for m in messages],
+            "params": params,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, endpoint, key):
+        content = self._memory.get(key)
+        if content is None and self.persist:
+            content = self._load(key)
+            if content is not None:
+                self._memory.put(key, content, ttl=self.ttls[endpoint])
+        self._count(endpoint, "hits" if content is not None else "misses")
+        return content
+
+    def put(self, endpoint, key, content):
+        ttl = self.ttls[endpoint]
+        self._memory.put(key, content, ttl=ttl)
+        if self.persist:
+            self._store(endpoint, key, content, time.time() + ttl)
+
+    def _count(self, endpoint, outcome):
+        with self._lock:
+            counters = self.stats.setdefault(endpoint, {"hits": 0, "misses": 0})
+            counters[outcome] += 1
+
+    def _ensure_schema(self, conn):
+        if not self._schema_ready:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    endpoint TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            self._schema_ready = True
+
+    def _load(self, key):
+        with storage.connect("llm_cache.db") as conn:
+            self._ensure_schema(conn)
+            row = conn.execute(
+                "SELECT content FROM llm_responses WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row["content"] if row else None
+
+    def _store(self, endpoint, key, content, expires_at):
+        with storage.connect("llm_cache.db") as conn:
+            self._ensure_schema(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, endpoint, content, expires_at) VALUES (?, ?, ?, ?)",
+                (key, endpoint, content, expires_at),
+            )
+            conn.execute("DELETE FROM llm_responses WHERE expires_at <= ?", (time.time(),))
+
+
+response_cache = ResponseCache(_load_ttls(), LLM_CACHE_MAX_BYTES, persist=LLM_CACHE_PERSIST)
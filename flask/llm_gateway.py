@@ -0,0 +1,363 @@
+import json
+import os
+import threading
+import time
+
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+import metrics
+import model_router
+import prompt_budget
+import scheduler
+from llm_cache import response_cache
+from singleflight import SingleFlight
+
+# Per-endpoint request timeout in seconds, overridable with LLM_TIMEOUTS="roadmap=120,quiz=20"
+DEFAULT_TIMEOUTS = {
+    "grade": 60,
+    "quiz": 30,
+    "quiz_feedback": 15,
+    "roadmap": 90,
+    "assign_tags": 15,
+    "course_recommendations": 30,
+    "module_suggestions": 30,
+    "find_similar_courses": 30,
+}
+# HTTP connection pool shared by every call
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+# Attempts per call, including the first, for 429/5xx/timeout/connection errors
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+LLM_RETRY_MAX_WAIT = float(os.getenv("LLM_RETRY_MAX_WAIT", "8"))
+# Consecutive failures that open a model's circuit, and how long it stays open
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+# Share one upstream call between concurrent identical calls
+LLM_SINGLEFLIGHT = os.getenv("LLM_SINGLEFLIGHT", "1") == "1"
+
+
+# Raised instead of calling a model whose circuit is open or whose slots are all busy
+class LLMUnavailableError(Exception):
+    pass
+
+
+# Raised when the scheduler turns a call away; retry_after is in seconds
+class LLMOverloadedError(LLMUnavailableError):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _load_timeouts():
+    timeouts = dict(DEFAULT_TIMEOUTS)
+    for item in os.getenv("LLM_TIMEOUTS", "").split(","):
+        if "=" in item:
+            endpoint, seconds = item.split("=", 1)
+            timeouts[endpoint.strip()] = float(seconds)
+    return timeouts
+
+
+TIMEOUTS = _load_timeouts()
+
+
+# Closed: calls go through. Open: calls fail fast until the reset period has
+# passed. Half open: one trial call decides whether to close or reopen.
+class CircuitBreaker:
+    def __init__(self, threshold, reset_seconds):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_running or time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+_client = None
+_client_lock = threading.Lock()
+_breakers = {}
+_state_lock = threading.Lock()
+inflight = SingleFlight()
+
+
+# The Groq SDK is imported and its client built on first use, so importing
+# the app stays cheap and a forked server process gets its own connections
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import httpx
+                from groq import Groq
+
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+                    ),
+                )
+                # Retries are handled here, not by the SDK
+                _client = Groq(api_key=os.getenv("GROQ_API_KEY"), http_client=http_client, max_retries=0)
+    return _client
+
+
+# Models whose circuit is currently open, for health checks
+def open_circuits():
+    with _state_lock:
+        return sorted(model for model, breaker in _breakers.items() if breaker.opened_at is not None)
+
+
+def _breaker(model):
+    with _state_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET_SECONDS)
+        return _breakers[model]
+
+
+# Wait for the model's scheduler under the current priority, then check its
+# circuit. Returns the tokens reserved, to release when the call is done.
+def _admit(model, params):
+    prompt = "".join(str(message.get("content", "")) for message in params.get("messages", []))
+    tokens = prompt_budget.count_tokens(prompt) + params.get("max_tokens", 1024)
+    try:
+        reserved = scheduler.acquire(model, tokens)
+    except scheduler.AdmissionError as e:
+        raise LLMOverloadedError(str(e), e.retry_after) from None
+    if not _breaker(model).allow():
+        scheduler.release(model, reserved, 0)
+        raise LLMUnavailableError(f"Model {model} is unavailable, circuit is open")
+    return reserved
+
+
+# Hold the model's queue for as long as Groq asks after a 429
+def _pause_if_rate_limited(model, error):
+    from groq import RateLimitError
+
+    if isinstance(error, RateLimitError):
+        retry_after = error.response.headers.get("retry-after") if error.response is not None else None
+        try:
+            scheduler.pause(model, float(retry_after))
+        except (TypeError, ValueError):
+            scheduler.pause(model, 1)
+
+
+def _used_tokens(usage):
+    return getattr(usage, "total_tokens", None)
+
+
+def _is_transient(error):
+    from groq import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+
+    if isinstance(error, (APITimeoutError, APIConnectionError, RateLimitError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+# Failures that say the backend itself is unhealthy; 429s only mean "slow down"
+def _is_backend_failure(error):
+    from groq import RateLimitError
+
+    return _is_transient(error) and not isinstance(error, RateLimitError)
+
+
+# Upstream latency of one call, retries included, labelled with its error type if it failed
+def _record_call(endpoint, model, start, error=None):
+    outcome = "ok" if error is None else type(error).__name__
+    metrics.llm_request_seconds.observe(time.perf_counter() - start, endpoint=endpoint, model=model, outcome=outcome)
+
+
+# Run one chat completion for an endpoint with its timeout, jittered retries,
+# the model's circuit breaker and concurrency cap. Returns the SDK completion.
+# Every attempt waits for its own turn with the scheduler, so a retry after
+# a 429 also waits out the model's pause and its rate limits, or is turned
+# away with LLMOverloadedError when that would take too long.
+def chat_completion(endpoint, **params):
+    model = params["model"]
+    breaker = _breaker(model)
+
+    start = time.perf_counter()
+    completion = None
+    try:
+        for attempt in Retrying(
+            stop=stop_after_attempt(LLM_RETRY_ATTEMPTS),
+            wait=wait_random_exponential(multiplier=0.5, max=LLM_RETRY_MAX_WAIT),
+            retry=retry_if_exception(_is_transient),
+            before_sleep=lambda state: _pause_if_rate_limited(model, state.outcome.exception()),
+            reraise=True,
+        ):
+            with attempt:
+                reserved = _admit(model, params)
+                try:
+                    completion = get_client().chat.completions.create(
+                        timeout=TIMEOUTS.get(endpoint, 30), **params
+                    )
+                finally:
+                    scheduler.release(model, reserved, _used_tokens(getattr(completion, "usage", None)))
+    except LLMUnavailableError:
+        raise  # Turned away before reaching the model
+    except Exception as e:
+        _record_call(endpoint, model, start, e)
+        _pause_if_rate_limited(model, e)
+        if _is_backend_failure(e):
+            breaker.record_failure()
+        else:
+            # Client errors such as a bad request do not count against the model
+            breaker.record_success()
+        raise
+
+    _record_call(endpoint, model, start)
+    metrics.record_usage(endpoint, model, completion.usage)
+    breaker.record_success()
+    return completion
+
+
+# Stream a chat completion for an endpoint, yielding content deltas as they
+# arrive. Only opening the stream is retried, each attempt waiting for its
+# turn like chat_completion; the model's slot is held until the stream is
+# exhausted or closed. Streams are not hedged, since their output is
+# already on its way to the client, but use the best-ranked model.
+def stream_chat(endpoint, **params):
+    model = params["model"] = model_router.rank(endpoint, params["model"])[0]
+    breaker = _breaker(model)
+
+    start = time.perf_counter()
+    reserved = None
+    usage = None
+    try:
+        try:
+            for attempt in Retrying(
+                stop=stop_after_attempt(LLM_RETRY_ATTEMPTS),
+                wait=wait_random_exponential(multiplier=0.5, max=LLM_RETRY_MAX_WAIT),
+                retry=retry_if_exception(_is_transient),
+                before_sleep=lambda state: _pause_if_rate_limited(model, state.outcome.exception()),
+                reraise=True,
+            ):
+                with attempt:
+                    reserved = _admit(model, params)
+                    try:
+                        stream = get_client().chat.completions.create(
+                            timeout=TIMEOUTS.get(endpoint, 30), stream=True, **params
+                        )
+                    except Exception:
+                        scheduler.release(model, reserved)
+                        reserved = None
+                        raise
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                # Groq reports usage on the last chunk of a stream
+                x_groq = getattr(chunk, "x_groq", None)
+                usage = getattr(x_groq, "usage", None) or usage
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            _record_call(endpoint, model, start, e)
+            _pause_if_rate_limited(model, e)
+            if _is_transient(e):
+                model_router.record(endpoint, model, time.perf_counter() - start, False)
+            if _is_backend_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        _record_call(endpoint, model, start)
+        model_router.record(endpoint, model, time.perf_counter() - start, True)
+        metrics.record_usage(endpoint, model, usage)
+        breaker.record_success()
+    finally:
+        if reserved is not None:
+            scheduler.release(model, reserved, _used_tokens(usage))
+
+
+# Chat completion from the best-ranked model for the endpoint, hedged to the
+# next model when it is slow. params["model"] is the route's preferred model.
+# Only an unavailable model or a transient error fails over to the next one,
+# and only transient errors from Groq count against a model's ranking.
+def routed_completion(endpoint, **params):
+    return model_router.complete(
+        endpoint, params, lambda routed: chat_completion(endpoint, **routed), _should_fail_over, _is_transient
+    )
+
+
+def _should_fail_over(error):
+    return isinstance(error, LLMUnavailableError) or _is_transient(error)
+
+
+# Message content of a completion. Endpoints with a response cache TTL
+# reuse earlier completions for identical prompts, and identical concurrent
+# calls are coalesced into one. validate(content) says whether a reply is
+# usable by the caller; only usable replies are cached, so a bad one is not
+# served again for the whole TTL. By default any valid JSON is usable.
+def chat(endpoint, validate=None, **params):
+    validate = validate or _is_json
+    key = None
+    if response_cache.enabled(endpoint):
+        key = response_cache.make_key(**params)
+        cached = response_cache.get(endpoint, key)
+        if cached is not None and validate(cached):
+            return cached
+
+    # Identical calls already in flight share one upstream completion
+    if LLM_SINGLEFLIGHT:
+        flight_key = f"{endpoint}:{key or response_cache.make_key(**params)}"
+        message_content = inflight.do(
+            flight_key,
+            lambda: routed_completion(endpoint, **params).choices[0].message.content,
+            label=endpoint,
+        )
+    else:
+        message_content = routed_completion(endpoint, **params).choices[0].message.content
+
+    if key is not None and validate(message_content):
+        response_cache.put(endpoint, key, message_content)
+    return message_content
+
+
+def _is_json(content):
+    try:
+        json.loads(content)
+        return True
+    except (TypeError, json.JSONDecodeError):
+        return False
+
+
+# validate for chat(): content is a JSON object whose key holds a list
+def has_list(key):
+    def validate(content):
+        try:
+            value = json.loads(content)
+        except (TypeError, json.JSONDecodeError):
+            return False
+        return isinstance(value, dict) and isinstance(value.get(key), list)
+
+    return validate
+
+
+# Parsed JSON content of a completion; raises json.JSONDecodeError when invalid
+def chat_json(endpoint, **params):
+    content = chat(endpoint, **params)
+    with metrics.stage("parse"):
+        return json.loads(content.strip())
@@ -0,0 +1,144 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import has_request_context, request
+
+# Latency buckets in seconds, wide enough for multi-minute model calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', bound)])} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+# Register a function called at scrape time that returns
+# (name, type, help, [(labels dict, value), ...]) for values kept elsewhere
+def register_collector(collect):
+    _collectors.append(collect)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        name, metric_type, help_text, samples = collect()
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples:
+            lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+http_request_seconds = Histogram(
+    "edusync_http_request_seconds", "Time spent handling HTTP requests", ("route", "method", "status")
+)
+stage_seconds = Histogram(
+    "edusync_stage_seconds", "Time spent in each processing stage of a route", ("route", "stage")
+)
+llm_request_seconds = Histogram(
+    "edusync_llm_request_seconds", "Upstream model call latency, including retries", ("endpoint", "model", "outcome")
+)
+llm_tokens_total = Counter(
+    "edusync_llm_tokens_total", "Prompt and completion tokens reported by the model", ("endpoint", "model", "kind")
+)
+errors_total = Counter("edusync_errors_total", "Errors by route and exception type", ("route", "type"))
+
+
+def _current_route():
+    if has_request_context():
+        return request.endpoint or "unknown"
+    return "background"
+
+
+# Time a block as one stage of the current route, e.g. stage("pdf_download")
+@contextmanager
+def stage(name):
+    with stage_seconds.time(route=_current_route(), stage=name):
+        yield
+
+
+def record_error(error):
+    errors_total.inc(route=_current_route(), type=type(error).__name__)
+
+
+def record_usage(endpoint, model, usage):
+    if usage is None:
+        return
+    llm_tokens_total.inc(usage.prompt_tokens or 0, endpoint=endpoint, model=model, kind="prompt")
+    llm_tokens_total.inc(usage.completion_tokens or 0, endpoint=endpoint, model=model, kind="completion")
@@ -0,0 +1,235 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import scheduler
+
+# Latency each endpoint should answer within, in seconds. A model whose
+# recent p95 is above it is tried after the models that meet it. Overridable
+# with LLM_LATENCY_TARGETS="roadmap=30,quiz=5".
+DEFAULT_LATENCY_TARGETS = {
+    "grade": 8,
+    "quiz": 6,
+    "quiz_feedback": 3,
+    "roadmap": 20,
+    "assign_tags": 3,
+    "course_recommendations": 10,
+    "module_suggestions": 6,
+    "find_similar_courses": 6,
+}
+# Models to try per endpoint, best first. The model a route asks for is
+# always included. Overridable with
+# LLM_MODEL_ROUTES="roadmap=llama-3.1-8b-instant|llama-3.3-70b-versatile,quiz=llama-3.1-8b-instant"
+DEFAULT_MODEL_ROUTES = {
+    "grade": ["llama-3.1-8b-instant", "llama-3.3-70b-versatile"],
+    "quiz": ["llama-3.1-8b-instant", "llama-3.3-70b-versatile"],
+    "quiz_feedback": ["llama-3.1-8b-instant", "llama-3.3-70b-versatile"],
+    "roadmap": ["llama-3.1-8b-instant", "llama-3.3-70b-versatile"],
+    "assign_tags": ["llama-3.1-8b-instant", "llama-3.3-70b-versatile"],
+    "course_recommendations": ["deepseek-r1-distill-llama-70b", "llama-3.3-70b-versatile"],
+    "module_suggestions": ["llama-3.1-8b-instant", "llama-3.3-70b-versatile"],
+    "find_similar_courses": ["llama-3.1-8b-instant", "llama-3.3-70b-versatile"],
+}
+# Send a duplicate to the next model when the first has not answered in time.
+# The delay is set per endpoint with LLM_HEDGE_DELAYS="quiz=2"; without one an
+# endpoint hedges at its primary model's recent p95, capped by its target.
+LLM_HEDGING = os.getenv("LLM_HEDGING", "1") == "1"
+# Threads running routed calls, shared by all requests
+LLM_ROUTER_WORKERS = int(os.getenv("LLM_ROUTER_WORKERS", "256"))
+# Rolling statistics keep this many recent calls per endpoint and model,
+# and forget calls older than LLM_ROUTER_WINDOW_SECONDS
+LLM_ROUTER_WINDOW = int(os.getenv("LLM_ROUTER_WINDOW", "100"))
+LLM_ROUTER_WINDOW_SECONDS = float(os.getenv("LLM_ROUTER_WINDOW_SECONDS", "300"))
+# Calls needed before a model's statistics affect its rank
+LLM_ROUTER_MIN_SAMPLES = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "10"))
+
+
+def _load_seconds(name, defaults):
+    values = dict(defaults)
+    for item in os.getenv(name, "").split(","):
+        if "=" in item:
+            endpoint, seconds = item.split("=", 1)
+            values[endpoint.strip()] = float(seconds)
+    return values
+
+
+def _load_routes():
+    routes = {endpoint: list(models) for endpoint, models in DEFAULT_MODEL_ROUTES.items()}
+    for item in os.getenv("LLM_MODEL_ROUTES", "").split(","):
+        if "=" in item:
+            endpoint, models = item.split("=", 1)
+            routes[endpoint.strip()] = [model.strip() for model in models.split("|") if model.strip()]
+    return routes
+
+
+LATENCY_TARGETS = _load_seconds("LLM_LATENCY_TARGETS", DEFAULT_LATENCY_TARGETS)
+HEDGE_DELAYS = _load_seconds("LLM_HEDGE_DELAYS", {})
+MODEL_ROUTES = _load_routes()
+
+llm_hedges_total = metrics.Counter(
+    "edusync_llm_hedges_total", "Hedges sent, and answers that came from a model other than the first", ("endpoint", "result")
+)
+
+
+# Recent (time, latency, ok) samples for one endpoint and model
+class LatencyWindow:
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self._lock:
+            self.samples.append((time.monotonic(), latency, ok))
+
+    def _recent(self):
+        cutoff = time.monotonic() - LLM_ROUTER_WINDOW_SECONDS
+        with self._lock:
+            while self.samples and self.samples[0][0] < cutoff:
+                self.samples.popleft()
+            return list(self.samples)
+
+    # (p50, p95, error rate), or None without enough recent samples
+    def summary(self):
+        samples = self._recent()
+        if len(samples) < LLM_ROUTER_MIN_SAMPLES:
+            return None
+        latencies = sorted(latency for _, latency, ok in samples if ok)
+        error_rate = 1 - len(latencies) / len(samples)
+        if not latencies:
+            return None, None, error_rate
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return p50, p95, error_rate
+
+
+_windows = {}
+_windows_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=LLM_ROUTER_WORKERS, thread_name_prefix="llm-route")
+
+
+def _window(endpoint, model):
+    key = (endpoint, model)
+    with _windows_lock:
+        if key not in _windows:
+            _windows[key] = LatencyWindow(LLM_ROUTER_WINDOW)
+        return _windows[key]
+
+
+def record(endpoint, model, latency, ok):
+    _window(endpoint, model).record(latency, ok)
+
+
+# Models for an endpoint, best first: the configured order, except that
+# models failing most calls, then models slower than the target, move back.
+# Statistics expire, so a demoted model gets its place back after a while.
+def rank(endpoint, model):
+    models = MODEL_ROUTES.get(endpoint) or []
+    if model not in models:
+        models = [model] + models
+    target = LATENCY_TARGETS.get(endpoint)
+
+    def sort_key(item):
+        position, candidate = item
+        summary = _window(endpoint, candidate).summary()
+        if summary is None:
+            return (False, False, position)
+        _, p95, error_rate = summary
+        slow = target is not None and p95 is not None and p95 > target
+        return (error_rate > 0.5, slow, position)
+
+    return [candidate for _, candidate in sorted(enumerate(models), key=sort_key)]
+
+
+def hedge_delay(endpoint, model):
+    if endpoint in HEDGE_DELAYS:
+        return HEDGE_DELAYS[endpoint]
+    target = LATENCY_TARGETS.get(endpoint, 30)
+    summary = _window(endpoint, model).summary()
+    if summary is None or summary[1] is None:
+        return target
+    return min(summary[1], target)
+
+
+# Result of call(params) from the best model for the endpoint. If it has not
+# answered within the hedge delay, the next model is asked as well and the
+# first answer wins; a call failing with an error for which failover(error)
+# is true moves on to the next model at once. Other errors, such as a bad
+# request, say nothing about the model and are raised as they are.
+# Only errors for which upstream(error) is true count against the model's
+# statistics, so a call turned away locally (queue full, circuit open)
+# does not demote a model that never saw it.
+# Calls that lose the race still finish in the background and are recorded.
+def complete(endpoint, params, call, failover, upstream):
+    models = rank(endpoint, params["model"])
+    results = queue.Queue()
+
+    def attempt(model):
+        start = time.perf_counter()
+        try:
+            result = call(dict(params, model=model))
+        except Exception as e:
+            if upstream(e):
+                record(endpoint, model, time.perf_counter() - start, False)
+            results.put((model, None, e))
+            return
+        record(endpoint, model, time.perf_counter() - start, True)
+        results.put((model, result, None))
+
+    if len(models) == 1:
+        attempt(models[0])
+        _, result, error = results.get()
+        if error is not None:
+            raise error
+        return result
+
+    scheduler.submit(_executor, attempt, models[0])
+    launched, pending = 1, 1
+    delay = hedge_delay(endpoint, models[0])
+    last_error = None
+    while True:
+        can_hedge = LLM_HEDGING and launched < len(models)
+        try:
+            model, result, error = results.get(timeout=delay if can_hedge else None)
+        except queue.Empty:
+            llm_hedges_total.inc(endpoint=endpoint, result="sent")
+            scheduler.submit(_executor, attempt, models[launched])
+            launched += 1
+            pending += 1
+            continue
+        pending -= 1
+        if error is None:
+            if model != models[0]:
+                # A hedge or a failover answered
+                llm_hedges_total.inc(endpoint=endpoint, result="won")
+            return result
+        if not failover(error):
+            raise error
+        last_error = error
+        if launched < len(models):
+            # Fail over to the next model right away
+            scheduler.submit(_executor, attempt, models[launched])
+            launched += 1
+            pending += 1
+        elif pending == 0:
+            raise last_error
+
+
+def collect_latency():
+    samples = []
+    with _windows_lock:
+        windows = list(_windows.items())
+    for (endpoint, model), window in windows:
+        summary = window.summary()
+        if summary is None:
+            continue
+        for name, value in zip(("p50", "p95"), summary[:2]):
+            if value is not None:
+                samples.append(({"endpoint": endpoint, "model": model, "quantile": name}, value))
+    return "edusync_llm_rolling_latency_seconds", "gauge", "Rolling model latency used for routing", samples
+
+
+metrics.register_collector(collect_latency)
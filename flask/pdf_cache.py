@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+
+import metrics
+import storage
+from lru import LRUCache
+from pdf_ingest import download_pdf, extract_pages
+
+# In-process tier, bounded by total characters of cached text
+PDF_TEXT_MEMORY_BYTES = int(os.getenv("PDF_TEXT_MEMORY_BYTES", str(64 * 1024 * 1024)))
+# On-disk tier, bounded by total size of the cached text files
+PDF_TEXT_DISK_BYTES = int(os.getenv("PDF_TEXT_DISK_BYTES", str(1024 * 1024 * 1024)))
+# How long a URL is trusted without revalidating it against the server
+PDF_URL_TRUST_SECONDS = float(os.getenv("PDF_URL_TRUST_SECONDS", "0"))
+
+_memory = LRUCache(PDF_TEXT_MEMORY_BYTES, sizeof=len)
+_disk_lock = threading.Lock()
+_schema_ready = False
+
+stats = {"memory_hits": 0, "disk_hits": 0, "not_modified": 0, "misses": 0}
+
+
+def _text_path(sha256):
+    return storage.data_path("pdf_text", f"{sha256}.txt")
+
+
+def _ensure_schema(conn):
+    global _schema_ready
+    if not _schema_ready:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pdf_urls (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                checked_at REAL NOT NULL
+            )
+            """
+        )
+        _schema_ready = True
+
+
+def _lookup_url(url):
+    with storage.connect("pdf_cache.db") as conn:
+        _ensure_schema(conn)
+        return conn.execute("SELECT * FROM pdf_urls WHERE url = ?", (url,)).fetchone()
+
+
+def _remember_url(url, sha256, etag, last_modified):
+    with storage.connect("pdf_cache.db") as conn:
+        _ensure_schema(conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO pdf_urls (url, sha256, etag, last_modified, checked_at) VALUES (?, ?, ?, ?, ?)",
+            (url, sha256, etag, last_modified, time.time()),
+        )
+
+
+def _touch_url(url):
+    with storage.connect("pdf_cache.db") as conn:
+        _ensure_schema(conn)
+        conn.execute("UPDATE pdf_urls SET checked_at = ? WHERE url = ?", (time.time(), url))
+
+
+# Text for a content hash from memory, then disk; None when neither has it
+def get_text(sha256):
+    text = _memory.get(sha256)
+    if text is not None:
+        stats["memory_hits"] += 1
+        return text
+
+    path = _text_path(sha256)
+    try:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None
+    os.utime(path)  # Mark as recently used for disk eviction
+    _memory.put(sha256, text)
+    stats["disk_hits"] += 1
+    return text
+
+
+def put_text(sha256, text):
+    _memory.put(sha256, text)
+
+    path = _text_path(sha256)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    _evict_disk()
+
+
+# Remove least recently used text files until the disk tier fits its budget
+def _evict_disk():
+    with _disk_lock:
+        directory = os.path.dirname(_text_path("x"))
+        entries = []
+        total = 0
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".txt"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= PDF_TEXT_DISK_BYTES:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= PDF_TEXT_DISK_BYTES:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+# Extracted text for a PDF URL. A URL seen before is revalidated with its
+# ETag/Last-Modified, so an unchanged PDF is neither downloaded nor parsed again.
+def get_pdf_text(url):
+    known = _lookup_url(url)
+    headers = {}
+    if known is not None:
+        if time.time() - known["checked_at"] < PDF_URL_TRUST_SECONDS:
+            text = get_text(known["sha256"])
+            if text is not None:
+                return text
+        if known["etag"]:
+            headers["If-None-Match"] = known["etag"]
+        if known["last_modified"]:
+            headers["If-Modified-Since"] = known["last_modified"]
+
+    with metrics.stage("pdf_download"):
+        download = download_pdf(url, headers=headers or None)
+    if download is None:
+        text = get_text(known["sha256"])
+        if text is not None:
+            stats["not_modified"] += 1
+            _touch_url(url)
+            return text
+        # The server says unchanged but our copy was evicted, fetch it again
+        with metrics.stage("pdf_download"):
+            download = download_pdf(url)
+
+    with download:
+        _remember_url(url, download.sha256, download.etag, download.last_modified)
+        text = get_text(download.sha256)
+        if text is not None:
+            return text
+        stats["misses"] += 1
+        with metrics.stage("pdf_extract"):
+            text = "\n".join(extract_pages(download.file))
+    put_text(download.sha256, text)
+    return text
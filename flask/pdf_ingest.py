@@ -0,0 +1,129 @@
+import hashlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+from PyPDF2 import PdfReader
+
+# Hard cap on the size of a downloaded PDF
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(50 * 1024 * 1024)))
+# Size of each chunk read from the download stream
+PDF_CHUNK_SIZE = int(os.getenv("PDF_CHUNK_SIZE", str(64 * 1024)))
+# Downloads larger than this are spooled to a temp file instead of memory
+PDF_SPOOL_BYTES = int(os.getenv("PDF_SPOOL_BYTES", str(4 * 1024 * 1024)))
+PDF_DOWNLOAD_TIMEOUT = float(os.getenv("PDF_DOWNLOAD_TIMEOUT", "30"))
+# Documents with at least this many pages are extracted on the process pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+
+class PdfTooLargeError(Exception):
+    pass
+
+
+# A downloaded PDF, spooled to memory or disk, with its content hash
+# and the cache validators the server sent
+class DownloadedPdf:
+    def __init__(self, file, sha256, etag=None, last_modified=None):
+        self.file = file
+        self.sha256 = sha256
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Stream a PDF into a spooled temp file, enforcing PDF_MAX_BYTES.
+# Returns None when a conditional request comes back 304 Not Modified.
+def download_pdf(url, headers=None):
+    with requests.get(url, headers=headers, stream=True, timeout=PDF_DOWNLOAD_TIMEOUT) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+
+        # Reject early when the server tells us the size up front
+        content_length = response.headers.get("Content-Length")
+        if content_length and content_length.isdigit() and int(content_length) > PDF_MAX_BYTES:
+            raise PdfTooLargeError(f"PDF is larger than the {PDF_MAX_BYTES} byte limit")
+
+        file = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_BYTES, suffix=".pdf")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            for chunk in response.iter_content(chunk_size=PDF_CHUNK_SIZE):
+                size += len(chunk)
+                if size > PDF_MAX_BYTES:
+                    raise PdfTooLargeError(f"PDF is larger than the {PDF_MAX_BYTES} byte limit")
+                digest.update(chunk)
+                file.write(chunk)
+        except Exception:
+            file.close()
+            raise
+
+        file.seek(0)
+        return DownloadedPdf(
+            file,
+            digest.hexdigest(),
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+
+
+def _extract_page_range(path, start, stop):
+    # Runs in a pool process, so it opens its own reader
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+# Workers are started by a fork server rather than forked from this
+# process, whose many threads may hold locks at the moment of a fork
+def _get_extract_pool():
+    global _extract_pool
+    if _extract_pool is None:
+        with _extract_pool_lock:
+            if _extract_pool is None:
+                _extract_pool = ProcessPoolExecutor(
+                    max_workers=PDF_EXTRACT_WORKERS, mp_context=multiprocessing.get_context("forkserver")
+                )
+    return _extract_pool
+
+
+# Return the text of every page of a seekable PDF file, in page order
+def extract_pages(file):
+    reader = PdfReader(file)
+    page_count = len(reader.pages)
+
+    if page_count < PDF_PARALLEL_MIN_PAGES or PDF_EXTRACT_WORKERS <= 1:
+        return [page.extract_text() or "" for page in reader.pages]
+
+    # Pool workers need a path they can open, so copy the spool to a named file
+    file.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as named:
+        shutil.copyfileobj(file, named, PDF_CHUNK_SIZE)
+    try:
+        step = -(-page_count // PDF_EXTRACT_WORKERS)
+        futures = [
+            _get_extract_pool().submit(_extract_page_range, named.name, start, min(start + step, page_count))
+            for start in range(0, page_count, step)
+        ]
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+        return pages
+    finally:
+        os.remove(named.name)
+
@@ -0,0 +1,167 @@
+import cProfile
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+import storage
+
+# Fraction of requests profiled; 0 profiles only requests with the header
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Requests whose header carries PROFILE_TOKEN are always profiled, and the
+# admin endpoints need the same header. Without a token both are disabled,
+# so clients cannot make the service profile them or read its captures.
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Debug-Profile")
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+# "collapsed" samples the request's stack into a flame graph input file
+# (flamegraph.pl, speedscope); "pstats" runs cProfile for snakeviz or pstats
+PROFILE_FORMAT = os.getenv("PROFILE_FORMAT", "collapsed")
+# Seconds between stack samples in collapsed mode
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+# Sampled captures of requests faster than this are dropped
+PROFILE_MIN_SECONDS = float(os.getenv("PROFILE_MIN_SECONDS", "0"))
+# Captures kept on disk, newest first
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(storage.DATA_DIR, "profiles"))
+
+EXTENSIONS = {"collapsed": ".collapsed", "pstats": ".prof"}
+_NAME_PATTERN = re.compile(r"^(\d{8}T\d{6})-([\w.-]+)-(\d+)ms-[0-9a-f]{8}\.(collapsed|prof)$")
+_write_lock = threading.Lock()
+
+
+# Samples one thread's Python stack on a timer and counts each distinct stack
+class StackSampler:
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# A profile of one request, from start() until finish()
+class Capture:
+    def __init__(self, forced):
+        self.forced = forced
+        self.started = time.perf_counter()
+        if PROFILE_FORMAT == "pstats":
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+                return
+            except ValueError:
+                pass  # Python 3.12+ allows one cProfile at a time; sample this one instead
+        self.profiler = StackSampler(threading.get_ident(), PROFILE_INTERVAL)
+        self.profiler.start()
+
+    # Stop profiling and write the capture. Returns its file name, or None
+    # when a sampled request was too fast to keep.
+    def finish(self, label):
+        if isinstance(self.profiler, cProfile.Profile):
+            self.profiler.disable()
+        else:
+            self.profiler.stop()
+        elapsed = time.perf_counter() - self.started
+        if not self.forced and elapsed < PROFILE_MIN_SECONDS:
+            return None
+
+        label = re.sub(r"[^\w.-]", "_", label)
+        pstats = isinstance(self.profiler, cProfile.Profile)
+        name = (
+            f"{time.strftime('%Y%m%dT%H%M%S')}-{label}-{int(elapsed * 1000)}ms-{uuid.uuid4().hex[:8]}"
+            f"{EXTENSIONS['pstats' if pstats else 'collapsed']}"
+        )
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, name)
+        if pstats:
+            self.profiler.dump_stats(path)
+        else:
+            self.profiler.write(path)
+        _prune()
+        return name
+
+
+def authorized(token):
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+# A Capture when this request should be profiled, else None. header is the
+# value of PROFILE_HEADER on the request, if any. Costs one comparison and
+# one random number per request when profiling is off.
+def start(header=None):
+    if header:
+        if authorized(header):
+            return Capture(forced=True)
+        return None
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return Capture(forced=False)
+    return None
+
+
+def _prune():
+    with _write_lock:
+        names = sorted((name for name in os.listdir(PROFILE_DIR) if _NAME_PATTERN.match(name)), reverse=True)
+        for name in names[PROFILE_KEEP:]:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name))
+            except FileNotFoundError:
+                pass
+
+
+# Recent captures, newest first
+def list_captures(limit=50):
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    captures = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        match = _NAME_PATTERN.match(name)
+        if match is None:
+            continue
+        try:
+            size = os.path.getsize(os.path.join(PROFILE_DIR, name))
+        except FileNotFoundError:
+            continue  # Pruned meanwhile
+        captures.append({
+            "name": name,
+            "route": match.group(2),
+            "duration_ms": int(match.group(3)),
+            "format": "pstats" if match.group(4) == "prof" else "collapsed",
+            "bytes": size,
+            "captured_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.strptime(match.group(1), "%Y%m%dT%H%M%S")),
+        })
+        if len(captures) >= limit:
+            break
+    return captures
+
+
+# True for names list_captures() can return, so paths cannot escape PROFILE_DIR
+def is_capture(name):
+    return _NAME_PATTERN.match(name) is not None
@@ -0,0 +1,154 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+
+import metrics
+
+# Tokens allowed for the request-supplied content embedded in each endpoint's
+# prompt (PDF text, descriptions, catalogs), not counting the fixed
+# instructions. Overridable with PROMPT_BUDGETS="grade=8000,roadmap=1500".
+DEFAULT_BUDGETS = {
+    "grade": 6000,
+    "quiz": 1500,
+    "quiz_feedback": 400,
+    "roadmap": 1000,
+    "assign_tags": 500,
+    "course_recommendations": 6000,
+    "module_suggestions": 600,
+    "find_similar_courses": 800,
+}
+# Context window per model; the prompt must leave room for max_tokens
+MODEL_CONTEXT_TOKENS = {
+    "llama-3.1-8b-instant": 131072,
+    "deepseek-r1-distill-llama-70b": 131072,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+# Every routed model uses the Llama 3 tokenizer, so one estimate serves them
+# all: a word costs about one token per this many characters and
+# punctuation is mostly a token per character
+CHARS_PER_WORD_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "4"))
+# Short lines repeated at least this often (page headers and footers) are kept once
+REPEATED_LINE_MIN = 3
+
+_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+_SPACE_PATTERN = re.compile(r"[ \t\f\v]+")
+
+prompt_tokens_saved_total = metrics.Counter(
+    "edusync_prompt_tokens_saved_total", "Input tokens removed to fit prompt budgets", ("endpoint",)
+)
+
+
+def _load_budgets():
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in os.getenv("PROMPT_BUDGETS", "").split(","):
+        if "=" in item:
+            endpoint, tokens = item.split("=", 1)
+            budgets[endpoint.strip()] = int(tokens)
+    return budgets
+
+
+BUDGETS = _load_budgets()
+
+
+# Estimated tokens of text, for budgets, scheduling and grading chunks
+def count_tokens(text):
+    return sum(math.ceil(len(piece) / CHARS_PER_WORD_TOKEN) for piece in _PIECE_PATTERN.findall(text))
+
+
+# Tokens available for an endpoint's content with the given model
+def budget(endpoint, model, max_tokens=0):
+    context = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+    return min(BUDGETS.get(endpoint, DEFAULT_CONTEXT_TOKENS), context - max_tokens)
+
+
+# Compact JSON for embedding in prompts
+def dumps(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _report(endpoint, before, after):
+    if after < before:
+        prompt_tokens_saved_total.inc(before - after, endpoint=endpoint)
+        print(f"Prompt budget for {endpoint}: {before} -> {after} tokens, saved {before - after}")
+
+
+# Collapse whitespace and blank lines and keep repeated short lines once
+def _compact(text):
+    lines = [_SPACE_PATTERN.sub(" ", line).strip() for line in text.split("\n")]
+    counts = Counter(line for line in lines if line and len(line) < 80)
+    seen = set()
+    kept = []
+    for line in lines:
+        if not line:
+            continue
+        if counts.get(line, 0) >= REPEATED_LINE_MIN:
+            if line in seen:
+                continue
+            seen.add(line)
+        kept.append(line)
+    return "\n".join(kept)
+
+
+# Text that fits the endpoint's budget. Text over budget is compacted first;
+# if that is not enough, the middle is cut, since the start and the end of a
+# document are where its introduction and conclusions are.
+def fit_text(endpoint, model, text, max_tokens=0):
+    limit = budget(endpoint, model, max_tokens)
+    before = count_tokens(text)
+    if before <= limit:
+        return text
+
+    text = _compact(text)
+    tokens = count_tokens(text)
+    keep = len(text)
+    while tokens > limit and keep > 0:
+        keep = int(keep * min(limit / tokens, 0.95))
+        head = text[: keep * 2 // 3]
+        tail = text[len(text) - (keep - len(head)):] if keep > len(head) else ""
+        fitted = f"{head}\n[... {len(text) - keep} characters omitted ...]\n{tail}"
+        tokens = count_tokens(fitted)
+    if keep < len(text):
+        text = fitted
+    _report(endpoint, before, tokens)
+    return text
+
+
+# The longest prefix of items, given most relevant first, whose serialized
+# form fits the endpoint's budget
+def fit_items(endpoint, model, items, serialize=dumps, max_tokens=0):
+    limit = budget(endpoint, model, max_tokens)
+    costs = [count_tokens(serialize(item)) + 1 for item in items]
+    before = sum(costs)
+    if before <= limit:
+        return items
+
+    used = 0
+    for count, cost in enumerate(costs):
+        if used + cost > limit:
+            break
+        used += cost
+    else:
+        count = len(items)
+    _report(endpoint, before, used)
+    return items[:count]
+
+
+# Items split into consecutive batches of at most max_items whose serialized
+# form fits the endpoint's budget, so a long list takes several calls
+# instead of losing its tail. An item over budget on its own gets a batch.
+def batch_items(endpoint, model, items, serialize=dumps, max_tokens=0, max_items=None):
+    limit = budget(endpoint, model, max_tokens)
+    batches = []
+    batch, used = [], 0
+    for item in items:
+        cost = count_tokens(serialize(item)) + 1
+        if batch and (used + cost > limit or (max_items and len(batch) >= max_items)):
+            batches.append(batch)
+            batch, used = [], 0
+        batch.append(item)
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
@@ -0,0 +1,320 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import scheduler
+import storage
+
+# Set to 0 to generate every /quiz live, as before the bank existed
+QUIZ_BANK_ENABLED = os.getenv("QUIZ_BANK_ENABLED", "1") == "1"
+# Questions per quiz
+QUIZ_SIZE = int(os.getenv("QUIZ_SIZE", "5"))
+# A pool with fewer never-served questions than this is refilled in the
+# background up to QUIZ_BANK_TARGET fresh questions
+QUIZ_BANK_LOW_WATERMARK = int(os.getenv("QUIZ_BANK_LOW_WATERMARK", "15"))
+QUIZ_BANK_TARGET = int(os.getenv("QUIZ_BANK_TARGET", "40"))
+# Pools stop growing at this size and recycle their least served questions
+QUIZ_BANK_MAX_POOL = int(os.getenv("QUIZ_BANK_MAX_POOL", "300"))
+# Generation calls per refill, so a model repeating itself cannot loop forever
+QUIZ_BANK_MAX_BATCHES = int(os.getenv("QUIZ_BANK_MAX_BATCHES", "12"))
+QUIZ_BANK_WORKERS = int(os.getenv("QUIZ_BANK_WORKERS", "2"))
+# A refill claimed by a process that died is taken over after this long
+QUIZ_BANK_REFILL_LEASE = float(os.getenv("QUIZ_BANK_REFILL_LEASE", "300"))
+# Existing questions listed in a refill prompt so the model writes new ones
+QUIZ_BANK_AVOID = int(os.getenv("QUIZ_BANK_AVOID", "20"))
+# A pool whose last batch held only repeated questions is not refilled again
+# for this long
+QUIZ_BANK_EXHAUSTED_COOLDOWN = float(os.getenv("QUIZ_BANK_EXHAUSTED_COOLDOWN", "600"))
+
+quiz_bank_total = metrics.Counter(
+    "edusync_quiz_bank_total", "Quizzes by whether the bank served them (hit, partial, miss)", ("result",)
+)
+quiz_bank_questions_total = metrics.Counter(
+    "edusync_quiz_bank_questions_total", "Questions generated for the bank, new or duplicate", ("result",)
+)
+
+_SPACE_PATTERN = re.compile(r"\s+")
+
+
+def _normalize(text):
+    return _SPACE_PATTERN.sub(" ", str(text)).strip().lower()
+
+
+# Pool for a request: the course when one is given, else the description
+def pool_key(description, course_id=None):
+    if course_id:
+        return f"course:{course_id}"
+    return "text:" + hashlib.sha1(_normalize(description).encode()).hexdigest()
+
+
+def _question_hash(question):
+    return hashlib.sha1(_normalize(question.get("question", "")).encode()).hexdigest()
+
+
+# Pools of pre-generated questions in SQLite. Quizzes are sampled from the
+# questions a student has not seen yet, least served first; pools running
+# low on fresh questions are refilled on a background thread.
+# generate(description, avoid) returns {"quiz": [question, ...]} and may
+# raise; avoid is a list of question texts already in the pool.
+class QuizBank:
+    def __init__(self, generate, db_name="quiz_bank.db"):
+        self.generate = generate
+        self.db_name = db_name
+        self._refilling = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=QUIZ_BANK_WORKERS, thread_name_prefix="quiz-bank")
+        with storage.connect(self.db_name) as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS quiz_pools (
+                    pool TEXT PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    description_hash TEXT NOT NULL,
+                    refill_until REAL NOT NULL DEFAULT 0
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS quiz_questions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    pool TEXT NOT NULL,
+                    question_hash TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    served INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    UNIQUE (pool, question_hash)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS quiz_seen (
+                    pool TEXT NOT NULL,
+                    student_id TEXT NOT NULL,
+                    question_id INTEGER NOT NULL,
+                    PRIMARY KEY (pool, student_id, question_id)
+                )
+                """
+            )
+
+    # Register the pool's description. A course whose description changed
+    # starts over, since its old questions may no longer fit.
+    def _ensure_pool(self, conn, pool, description):
+        description_hash = hashlib.sha1(_normalize(description).encode()).hexdigest()
+        row = conn.execute("SELECT description_hash FROM quiz_pools WHERE pool = ?", (pool,)).fetchone()
+        if row is not None and row["description_hash"] == description_hash:
+            return
+        if row is not None:
+            conn.execute("DELETE FROM quiz_questions WHERE pool = ?", (pool,))
+            conn.execute("DELETE FROM quiz_seen WHERE pool = ?", (pool,))
+        conn.execute(
+            "INSERT OR REPLACE INTO quiz_pools (pool, description, description_hash, refill_until) VALUES (?, ?, ?, 0)",
+            (pool, description, description_hash),
+        )
+
+    # Up to size questions for the student, unseen ones first and least
+    # served first, marked as served. Anonymous requests only see the
+    # served counts, so they get the freshest questions in the pool.
+    # unseen_only leaves out questions the student has seen.
+    def _take(self, conn, pool, student_id, size, unseen_only=False):
+        rows = conn.execute(
+            """
+            SELECT q.id, q.question, q.served,
+                   EXISTS (SELECT 1 FROM quiz_seen s
+                           WHERE s.pool = q.pool AND s.student_id = ? AND s.question_id = q.id) AS seen
+            FROM quiz_questions q WHERE q.pool = ?
+            """,
+            (student_id or "", pool),
+        ).fetchall()
+        if unseen_only:
+            rows = [row for row in rows if not row["seen"]]
+        # Random tie-breaking so concurrent students do not all get the same quiz
+        ordered = sorted(rows, key=lambda row: (row["seen"], row["served"], random.random()))[:size]
+        ids = [row["id"] for row in ordered]
+        conn.executemany("UPDATE quiz_questions SET served = served + 1 WHERE id = ?", [(i,) for i in ids])
+        if student_id:
+            conn.executemany(
+                "INSERT OR IGNORE INTO quiz_seen (pool, student_id, question_id) VALUES (?, ?, ?)",
+                [(pool, student_id, i) for i in ids],
+            )
+        # Without a student, unseen means never served to anyone
+        unseen = sum(1 for row in ordered if not row["seen"] and (student_id or row["served"] == 0))
+        return [json.loads(row["question"]) for row in ordered], unseen
+
+    def _fresh_count(self, conn, pool):
+        return conn.execute(
+            "SELECT COUNT(*) FROM quiz_questions WHERE pool = ? AND served = 0", (pool,)
+        ).fetchone()[0]
+
+    # Store generated questions, skipping ones the pool already has. Returns
+    # the ids of the stored questions.
+    def _add(self, conn, pool, questions):
+        ids = []
+        for question in questions:
+            if not isinstance(question, dict) or not question.get("question"):
+                continue
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO quiz_questions (pool, question_hash, question, created_at) VALUES (?, ?, ?, ?)",
+                (pool, _question_hash(question), json.dumps(question), time.time()),
+            )
+            if cursor.rowcount:
+                ids.append(cursor.lastrowid)
+            quiz_bank_questions_total.inc(result="new" if cursor.rowcount else "duplicate")
+        return ids
+
+    def _unseen_count(self, conn, pool, student_id):
+        return conn.execute(
+            """
+            SELECT COUNT(*) FROM quiz_questions q WHERE q.pool = ? AND NOT EXISTS (
+                SELECT 1 FROM quiz_seen s WHERE s.pool = q.pool AND s.student_id = ? AND s.question_id = q.id)
+            """,
+            (pool, student_id),
+        ).fetchone()[0]
+
+    # Texts of questions the student has seen, newest first
+    def _seen_questions(self, conn, pool, student_id):
+        return [
+            json.loads(row["question"]).get("question", "")
+            for row in conn.execute(
+                """
+                SELECT q.question FROM quiz_questions q JOIN quiz_seen s
+                    ON s.pool = q.pool AND s.question_id = q.id AND s.student_id = ?
+                WHERE q.pool = ? ORDER BY q.id DESC LIMIT ?
+                """,
+                (student_id, pool, QUIZ_BANK_AVOID),
+            )
+        ]
+
+    # {"quiz": [...]} for a request. Served from the pool when it holds
+    # enough questions the student has not seen, otherwise generated live
+    # and kept for later quizzes. Errors from generate propagate.
+    def quiz(self, description, course_id=None, student_id=None):
+        pool = pool_key(description, course_id)
+        questions = None
+        avoid = []
+        with storage.connect(self.db_name) as conn:
+            self._ensure_pool(conn, pool, description)
+            total = conn.execute("SELECT COUNT(*) FROM quiz_questions WHERE pool = ?", (pool,)).fetchone()[0]
+            available = self._unseen_count(conn, pool, student_id) if student_id else total
+            if available >= QUIZ_SIZE:
+                questions, unseen = self._take(conn, pool, student_id, QUIZ_SIZE)
+                fresh = self._fresh_count(conn, pool)
+            elif student_id and total:
+                avoid = self._seen_questions(conn, pool, student_id)
+        if questions is not None:
+            quiz_bank_total.inc(result="hit" if unseen == QUIZ_SIZE else "partial")
+            if fresh < QUIZ_BANK_LOW_WATERMARK or unseen < QUIZ_SIZE:
+                self.refill(pool)
+            return {"quiz": questions}
+
+        if avoid:
+            # The student has seen most of the pool: fill the gap live with
+            # new questions and serve them with the ones still unseen. A
+            # model repeating itself is asked once more; after that the quiz
+            # is shorter rather than repeat questions the student has seen.
+            quiz_bank_total.inc(result="partial")
+            for _ in range(2):
+                response = self.generate(description, avoid)
+                with storage.connect(self.db_name) as conn:
+                    self._add(conn, pool, response.get("quiz") or [])
+                    if self._unseen_count(conn, pool, student_id) >= QUIZ_SIZE:
+                        break
+            with storage.connect(self.db_name) as conn:
+                questions, _ = self._take(conn, pool, student_id, QUIZ_SIZE, unseen_only=True)
+                if not questions:
+                    # Nothing new at all: a repeat beats an empty quiz
+                    questions, _ = self._take(conn, pool, student_id, QUIZ_SIZE)
+            self.refill(pool)
+            return {"quiz": questions}
+
+        # Not enough questions banked yet: answer live, as without the bank
+        quiz_bank_total.inc(result="miss")
+        response = self.generate(description, [])
+        with storage.connect(self.db_name) as conn:
+            ids = self._add(conn, pool, response.get("quiz") or [])
+            conn.executemany("UPDATE quiz_questions SET served = served + 1 WHERE id = ?", [(i,) for i in ids])
+            if student_id:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO quiz_seen (pool, student_id, question_id) VALUES (?, ?, ?)",
+                    [(pool, student_id, i) for i in ids],
+                )
+        self.refill(pool)
+        return response
+
+    # Start a background refill of the pool unless one is already running
+    # in this or another process
+    def refill(self, pool):
+        with self._lock:
+            if pool in self._refilling:
+                return
+            self._refilling.add(pool)
+        now = time.time()
+        with storage.connect(self.db_name) as conn:
+            claimed = conn.execute(
+                "UPDATE quiz_pools SET refill_until = ? WHERE pool = ? AND refill_until < ?",
+                (now + QUIZ_BANK_REFILL_LEASE, pool, now),
+            ).rowcount
+        if not claimed:
+            with self._lock:
+                self._refilling.discard(pool)
+            return
+        self._executor.submit(self._refill, pool)
+
+    def _refill(self, pool):
+        refill_until = 0
+        try:
+            for _ in range(QUIZ_BANK_MAX_BATCHES):
+                with storage.connect(self.db_name) as conn:
+                    row = conn.execute("SELECT description FROM quiz_pools WHERE pool = ?", (pool,)).fetchone()
+                    if row is None:
+                        return
+                    total = conn.execute("SELECT COUNT(*) FROM quiz_questions WHERE pool = ?", (pool,)).fetchone()[0]
+                    if self._fresh_count(conn, pool) >= QUIZ_BANK_TARGET or total >= QUIZ_BANK_MAX_POOL:
+                        return
+                    avoid = [
+                        json.loads(r["question"]).get("question", "")
+                        for r in conn.execute(
+                            "SELECT question FROM quiz_questions WHERE pool = ? ORDER BY id DESC LIMIT ?",
+                            (pool, QUIZ_BANK_AVOID),
+                        )
+                    ]
+                with metrics.stage("quiz_bank_refill"), scheduler.use("bulk", pool):
+                    response = self.generate(row["description"], avoid)
+                with storage.connect(self.db_name) as conn:
+                    if not self._add(conn, pool, response.get("quiz") or []):
+                        # The model has run out of new questions for this description
+                        refill_until = time.time() + QUIZ_BANK_EXHAUSTED_COOLDOWN
+                        return
+        except Exception as e:
+            metrics.record_error(e)
+            print(f"Quiz bank refill failed for {pool}: {str(e)}")
+        finally:
+            with storage.connect(self.db_name) as conn:
+                conn.execute("UPDATE quiz_pools SET refill_until = ? WHERE pool = ?", (refill_until, pool))
+            with self._lock:
+                self._refilling.discard(pool)
+
+    # Fill the pool for a description ahead of its first quiz
+    def warm(self, description, course_id=None):
+        pool = pool_key(description, course_id)
+        with storage.connect(self.db_name) as conn:
+            self._ensure_pool(conn, pool, description)
+        self.refill(pool)
+        return pool
+
+    def collect(self):
+        with storage.connect(self.db_name) as conn:
+            rows = conn.execute(
+                "SELECT SUM(served = 0) AS fresh, SUM(served > 0) AS served FROM quiz_questions"
+            ).fetchone()
+        return "edusync_quiz_bank_questions", "gauge", "Banked quiz questions by whether they were served", [
+            ({"state": "fresh"}, rows["fresh"] or 0),
+            ({"state": "served"}, rows["served"] or 0),
+        ]
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from lru import LRUCache
+
+# "llm": the model ranks the whole catalog, "prefilter": the model only sees
+# the local top-K candidates, "local": the local ranker answers on its own
+RECOMMENDER_MODE = os.getenv("RECOMMENDER_MODE", "prefilter")
+RECOMMENDER_TOP_K = int(os.getenv("RECOMMENDER_TOP_K", "50"))
+
+_rankers = LRUCache(int(os.getenv("RECOMMENDER_CACHED_CATALOGS", "16")))
+
+
+# Scores courses by how many of a user's interests appear in their tags.
+# The tag vocabulary maps each lower-cased tag to a column of the sparse
+# course-by-tag matrix, stored column-wise as an inverted index of postings.
+class CourseRanker:
+    def __init__(self, courses):
+        self.course_ids = [course["_id"] for course in courses]
+        self.vocabulary = {}
+        postings = []
+        for row, course in enumerate(courses):
+            for tag in {tag.lower() for tag in course.get("tags") or []}:
+                column = self.vocabulary.setdefault(tag, len(postings))
+                if column == len(postings):
+                    postings.append([])
+                postings[column].append(row)
+        self.postings = [np.array(rows, dtype=np.int32) for rows in postings]
+
+    # Number of matching interests per course, for every course at once
+    def score(self, interests):
+        columns = [self.vocabulary[i.lower()] for i in interests if i.lower() in self.vocabulary]
+        if not columns:
+            return np.zeros(len(self.course_ids), dtype=np.int64)
+        return np.bincount(
+            np.concatenate([self.postings[c] for c in columns]),
+            minlength=len(self.course_ids),
+        )
+
+    # Indices of the best scoring courses, ties kept in catalog order
+    def top_indices(self, interests, top_k=None, matched_only=True):
+        scores = self.score(interests)
+        order = np.argsort(-scores, kind="stable")
+        if matched_only:
+            order = order[: int(np.count_nonzero(scores))]
+        return order[:top_k] if top_k else order
+
+    # IDs of courses with at least one matching tag, most relevant first
+    def rank(self, interests, top_k=None):
+        return [self.course_ids[i] for i in self.top_indices(interests, top_k)]
+
+
+# Build a ranker for a catalog, reusing the one built for an identical catalog
+def get_ranker(courses):
+    fingerprint = hashlib.sha1(
+        json.dumps([[course["_id"], course.get("tags")] for course in courses], default=str).encode()
+    ).hexdigest()
+    ranker = _rankers.get(fingerprint)
+    if ranker is None:
+        ranker = CourseRanker(courses)
+        _rankers.put(fingerprint, ranker)
+    return ranker
@@ -0,0 +1,266 @@
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# Requests and tokens per minute allowed per model, matching the Groq
+# account's limits, e.g. LLM_RATE_LIMITS="llama-3.1-8b-instant=30:6000".
+# 0 or a missing model means no limit; 429s still pause a model.
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "")
+# In-flight calls allowed per model
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# Longest an interactive or a bulk call may wait for its turn. A call that
+# would wait longer is rejected up front so the route can answer 503.
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+LLM_BULK_QUEUE_TIMEOUT = float(os.getenv("LLM_BULK_QUEUE_TIMEOUT", "120"))
+# Share of a model's in-flight slots bulk calls may hold, so interactive
+# calls never queue behind a batch
+LLM_BULK_SHARE = float(os.getenv("LLM_BULK_SHARE", "0.75"))
+# Calls allowed to wait per model before new ones are rejected
+LLM_SCHEDULER_MAX_QUEUE = int(os.getenv("LLM_SCHEDULER_MAX_QUEUE", "512"))
+
+# Lower runs first
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+_context = contextvars.ContextVar("llm_schedule", default=("interactive", None))
+
+scheduler_total = metrics.Counter(
+    "edusync_llm_scheduler_total", "Scheduled model calls by outcome", ("model", "priority", "result")
+)
+scheduler_wait_seconds = metrics.Histogram(
+    "edusync_llm_scheduler_wait_seconds", "Time model calls waited for their turn", ("model", "priority")
+)
+
+
+# Raised when a call would wait too long; retry_after is in seconds
+class AdmissionError(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _load_limits():
+    limits = {}
+    for item in LLM_RATE_LIMITS.split(","):
+        if "=" in item:
+            model, values = item.split("=", 1)
+            rpm, _, tpm = values.partition(":")
+            limits[model.strip()] = (float(rpm or 0), float(tpm or 0))
+    return limits
+
+
+LIMITS = _load_limits()
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until amount is available, after refill()
+    def time_until(self, amount):
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+# Calls waiting for one model, run in priority order and, within a
+# priority, fairly across tenants (start-time fair queueing: a tenant that
+# has just used many tokens goes behind tenants that have not).
+class ModelScheduler:
+    def __init__(self, model, rpm=0, tpm=0):
+        self.model = model
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.waiting = []  # heap of (priority, virtual start, seq, tokens)
+        self.virtual_time = 0.0
+        self.tenant_finish = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _slot_limit(self, priority):
+        if priority == 0:
+            return LLM_MAX_CONCURRENCY
+        return max(1, int(LLM_MAX_CONCURRENCY * LLM_BULK_SHARE))
+
+    def _refill(self, now):
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.refill(now)
+
+    # Seconds until the rate limits allow requests and tokens more
+    def _rate_wait(self, now, requests, tokens):
+        wait = max(0.0, self.paused_until - now)
+        if self.requests is not None:
+            wait = max(wait, self.requests.time_until(requests))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.time_until(tokens))
+        return wait
+
+    # Take a slot and the call's tokens, waiting for the call's turn.
+    # Raises AdmissionError when the wait would exceed timeout.
+    def acquire(self, label, tenant, tokens, timeout):
+        priority = PRIORITIES.get(label, 0)
+        if self.tokens is not None:
+            tokens = min(tokens, self.tokens.capacity)
+        with self._cond:
+            now = arrived = time.monotonic()
+            self._refill(now)
+            ahead = [entry for entry in self.waiting if entry[0] <= priority]
+            estimate = self._rate_wait(now, len(ahead) + 1, sum(entry[3] for entry in ahead) + tokens)
+            if len(self.waiting) >= LLM_SCHEDULER_MAX_QUEUE or estimate > timeout:
+                scheduler_total.inc(model=self.model, priority=label, result="rejected")
+                raise AdmissionError(
+                    f"Model {self.model} is over its rate limit, retry later", max(1, math.ceil(estimate))
+                )
+
+            start = max(self.virtual_time, self.tenant_finish.get(tenant, 0.0))
+            self.tenant_finish[tenant] = start + max(tokens, 1)
+            entry = (priority, start, next(self._seq), tokens)
+            heapq.heappush(self.waiting, entry)
+            deadline = now + timeout
+            while True:
+                self._refill(now)
+                if (
+                    self.waiting[0] is entry
+                    and self.in_flight < self._slot_limit(priority)
+                    and self._rate_wait(now, 1, tokens) == 0
+                ):
+                    break
+                if now >= deadline:
+                    self.waiting.remove(entry)
+                    heapq.heapify(self.waiting)
+                    self._cond.notify_all()
+                    scheduler_total.inc(model=self.model, priority=label, result="timeout")
+                    raise AdmissionError(f"Model {self.model} is at its concurrency limit", 1)
+                wait = deadline - now
+                if self.waiting[0] is entry and self.in_flight < self._slot_limit(priority):
+                    wait = min(wait, self._rate_wait(now, 1, tokens))
+                self._cond.wait(wait)
+                now = time.monotonic()
+
+            heapq.heappop(self.waiting)
+            self.virtual_time = start
+            self._prune_tenants()
+            if self.requests is not None:
+                self.requests.level -= 1
+            if self.tokens is not None:
+                self.tokens.level -= tokens
+            self.in_flight += 1
+            # The next call in line may be runnable too
+            self._cond.notify_all()
+        scheduler_total.inc(model=self.model, priority=label, result="admitted")
+        scheduler_wait_seconds.observe(time.monotonic() - arrived, model=self.model, priority=label)
+        return tokens
+
+    # Free the slot. used is the call's real token count when known; the
+    # difference to what was reserved goes back to (or comes out of) the bucket.
+    def release(self, reserved, used=None):
+        with self._cond:
+            self.in_flight -= 1
+            if self.tokens is not None and used is not None:
+                self.tokens.level = min(self.tokens.capacity, self.tokens.level + reserved - used)
+            self._cond.notify_all()
+
+    # Hold every call for the model, e.g. after a 429 with Retry-After
+    def pause(self, seconds):
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _prune_tenants(self):
+        if len(self.tenant_finish) > 10000:
+            self.tenant_finish = {
+                tenant: finish for tenant, finish in self.tenant_finish.items() if finish > self.virtual_time
+            }
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get(model):
+    with _schedulers_lock:
+        if model not in _schedulers:
+            rpm, tpm = LIMITS.get(model, (0, 0))
+            _schedulers[model] = ModelScheduler(model, rpm, tpm)
+        return _schedulers[model]
+
+
+# Run the enclosed model calls with a priority ("interactive" or "bulk") on
+# behalf of a tenant such as a student or course
+@contextmanager
+def use(priority, tenant=None):
+    token = _context.set((priority, tenant))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+# Set the priority for the rest of the current request
+def set_context(priority, tenant=None):
+    _context.set((priority, tenant))
+
+
+def current():
+    return _context.get()
+
+
+# executor.submit that carries the caller's priority and tenant to the pool thread
+def submit(executor, fn, *args, **kwargs):
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+# Futures for fn(item) on the executor, in item order, with at most limit
+# running at once for this caller. Lets one request fan out without a
+# small shared pool capping every request together.
+def submit_bounded(executor, fn, items, limit):
+    slots = threading.BoundedSemaphore(max(1, limit))
+    futures = []
+    for item in items:
+        slots.acquire()
+        future = submit(executor, fn, item)
+        future.add_done_callback(lambda _: slots.release())
+        futures.append(future)
+    return futures
+
+
+# Wait for a turn on the model under the current priority. Returns the
+# tokens reserved, to pass to release(). Raises AdmissionError.
+def acquire(model, tokens):
+    priority, tenant = _context.get()
+    timeout = LLM_QUEUE_TIMEOUT if priority == "interactive" else LLM_BULK_QUEUE_TIMEOUT
+    return get(model).acquire(priority, tenant, tokens, timeout)
+
+
+def release(model, reserved, used=None):
+    get(model).release(reserved, used)
+
+
+def pause(model, seconds):
+    get(model).pause(seconds)
+
+
+def collect_queue():
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    samples = []
+    for scheduler in schedulers:
+        samples.append(({"model": scheduler.model, "state": "waiting"}, len(scheduler.waiting)))
+        samples.append(({"model": scheduler.model, "state": "in_flight"}, scheduler.in_flight))
+    return "edusync_llm_scheduler_calls", "gauge", "Model calls waiting for a turn or in flight", samples
+
+
+metrics.register_collector(collect_queue)
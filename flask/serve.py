@@ -0,0 +1,110 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from tornado import httputil
+from tornado.httpserver import HTTPServer
+from tornado.iostream import StreamClosedError
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes
+from tornado.wsgi import WSGIContainer
+from dotenv import load_dotenv
+
+# Settings in .env apply to this module and to app, imported below
+load_dotenv()
+
+# Production entry point: `python serve.py`. Tornado's event loop owns the
+# sockets, so idle keep-alive connections and slow clients cost no thread,
+# and the Flask views run on a large thread pool while they wait on the model.
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", os.getenv("PORT", "5000")))
+# Processes sharing the port; 0 means one per CPU
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "1"))
+# Requests each process handles at once, most of them waiting on model calls
+SERVE_THREADS = int(os.getenv("SERVE_THREADS", "256"))
+# Trust X-Forwarded-For/X-Real-Ip from a reverse proxy
+SERVE_XHEADERS = os.getenv("SERVE_XHEADERS", "0") == "1"
+
+
+# WSGIContainer that streams the response body as the app yields it, so the
+# SSE and NDJSON routes are not buffered. The whole response is produced on
+# one pool thread because stream_with_context keeps the request context in
+# that thread; writes are handed to the event loop and waited on, which
+# also stops a generator whose client has gone away.
+class StreamingWSGIContainer(WSGIContainer):
+    async def handle_request(self, request):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._respond, request, self.environ(request), loop)
+
+    def _respond(self, request, environ, loop):
+        connection = request.connection
+        response = {}
+        pending = []
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = status
+            response["headers"] = headers
+            return pending.append
+
+        def on_loop(fn, *args):
+            async def call():
+                result = fn(*args)
+                if result is not None:
+                    await result
+            asyncio.run_coroutine_threadsafe(call(), loop).result()
+
+        def send_headers(body):
+            status_code, reason = response["status"].split(" ", 1)
+            headers = httputil.HTTPHeaders()
+            for name, value in response["headers"]:
+                headers.add(name, value)
+            start_line = httputil.ResponseStartLine("HTTP/1.1", int(status_code), reason)
+            on_loop(connection.write_headers, start_line, headers, body)
+
+        app_response = self.wsgi_application(environ, start_response)
+        headers_sent = False
+        try:
+            for chunk in app_response:
+                if not chunk:
+                    continue
+                if headers_sent:
+                    on_loop(connection.write, chunk)
+                else:
+                    send_headers(b"".join(pending) + chunk)
+                    headers_sent = True
+            if not headers_sent:
+                send_headers(b"".join(pending))
+            on_loop(connection.finish)
+        except StreamClosedError:
+            return
+        finally:
+            if hasattr(app_response, "close"):
+                app_response.close()
+        self._log(int(response["status"].split(" ", 1)[0]), request)
+
+
+async def serve(sockets, application):
+    container = StreamingWSGIContainer(application, executor=ThreadPoolExecutor(
+        max_workers=SERVE_THREADS, thread_name_prefix="serve",
+    ))
+    server = HTTPServer(container, xheaders=SERVE_XHEADERS)
+    server.add_sockets(sockets)
+    await asyncio.Event().wait()
+
+
+def main():
+    sockets = bind_sockets(SERVE_PORT, SERVE_HOST)
+    # Importing before forking shares the loaded code between processes. The
+    # Groq client, thread pools and job workers are only created after the fork.
+    import app
+    import jobs
+
+    task_id = fork_processes(SERVE_WORKERS) if SERVE_WORKERS != 1 else None
+    # Only one process requeues local jobs interrupted by a restart
+    jobs.ensure_started(recover=task_id in (None, 0))
+    print(f"Serving on http://{SERVE_HOST}:{SERVE_PORT} (process {task_id or 0}, {SERVE_THREADS} threads)")
+    asyncio.run(serve(sockets, app.app))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+import storage
+from lru import LRUCache
+
+# Width of the hashed embedding; vectors are stored on disk as float16
+SIMILARITY_DIM = int(os.getenv("SIMILARITY_DIM", "512"))
+# A neighbour at least this similar may lend its cached results to a new course
+SIMILARITY_REUSE_THRESHOLD = float(os.getenv("SIMILARITY_REUSE_THRESHOLD", "0.85"))
+# Results kept in memory for ad-hoc queries without a course id; those
+# queries are not added to the index
+SIMILARITY_TEXT_RESULTS = int(os.getenv("SIMILARITY_TEXT_RESULTS", "10000"))
+# How often a process picks up courses indexed by other server processes
+SIMILARITY_REFRESH_SECONDS = float(os.getenv("SIMILARITY_REFRESH_SECONDS", "5"))
+# Rows written this long before the last refresh are read again, in case
+# another process committed them late
+SIMILARITY_REFRESH_OVERLAP = 60
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9+#]+")
+
+
+def _features(text):
+    words = _TOKEN_PATTERN.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+# Signed feature hashing of words and word bigrams into a fixed-width,
+# L2-normalized vector. crc32 keeps the hashing stable across processes.
+def embed(text):
+    vector = np.zeros(SIMILARITY_DIM, dtype=np.float32)
+    for feature in _features(text):
+        h = zlib.crc32(feature.encode())
+        vector[h % SIMILARITY_DIM] += 1.0 if h & 0x80000000 else -1.0
+    vector = np.sign(vector) * np.log1p(np.abs(vector))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def course_text(title, description):
+    return f"{title}\n{title}\n{description}"
+
+
+# Stable key for a course: its id when known, else a hash of its text
+def course_key(course_id, title, description):
+    if course_id:
+        return str(course_id)
+    normalized = re.sub(r"\s+", " ", f"{title}\n{description}").strip().lower()
+    return "text:" + hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def is_text_key(key):
+    return key.startswith("text:")
+
+
+# In-memory matrix of course vectors backed by SQLite, so courses are added
+# one at a time and a restart only reloads the rows. Each course can also
+# carry its cached list of similar external courses. Only courses with an id
+# are indexed; ad-hoc text queries are embedded on the fly. Server processes
+# sharing the database pick up each other's changes every
+# SIMILARITY_REFRESH_SECONDS.
+class SimilarityIndex:
+    def __init__(self, db_name="similarity.db"):
+        self.db_name = db_name
+        self.keys = []
+        self.rows = {}  # key -> row in self.vectors
+        self.titles = []
+        self.text_hashes = []
+        self.results = {}  # key -> cached similar courses
+        self.text_results = LRUCache(SIMILARITY_TEXT_RESULTS)
+        self.vectors = np.zeros((0, SIMILARITY_DIM), dtype=np.float32)
+        self._lock = threading.Lock()
+        self._loaded_until = 0.0
+        self._refreshed_at = time.monotonic()
+        self._load()
+
+    def _load(self):
+        with storage.connect(self.db_name) as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS course_vectors (
+                    key TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    similar TEXT,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS course_vectors_updated ON course_vectors (updated_at)")
+            # Ad-hoc queries used to be indexed; they only grew the matrix
+            conn.execute("DELETE FROM course_vectors WHERE key LIKE 'text:%'")
+        self._read(0.0)
+
+    # Apply rows changed since a time, from this or another process
+    def _read(self, since):
+        with storage.connect(self.db_name) as conn:
+            rows = conn.execute(
+                "SELECT key, title, text_hash, vector, similar, updated_at FROM course_vectors WHERE updated_at > ?",
+                (since,),
+            ).fetchall()
+        with self._lock:
+            for row in rows:
+                self._loaded_until = max(self._loaded_until, row["updated_at"])
+                vector = np.frombuffer(row["vector"], dtype=np.float16)
+                if vector.shape[0] != SIMILARITY_DIM or is_text_key(row["key"]):
+                    continue  # Stored with another dimension, re-embedded on next add
+                index = self.rows.get(row["key"])
+                if index is None:
+                    self._grow()
+                    index = self.rows[row["key"]] = len(self.keys)
+                    self.keys.append(row["key"])
+                    self.titles.append(row["title"])
+                    self.text_hashes.append(row["text_hash"])
+                elif self.text_hashes[index] != row["text_hash"]:
+                    self.titles[index] = row["title"]
+                    self.text_hashes[index] = row["text_hash"]
+                    self.results.pop(row["key"], None)
+                self.vectors[index] = vector
+                if row["similar"] is not None:
+                    self.results[row["key"]] = json.loads(row["similar"])
+
+    # Pick up courses other processes indexed, at most every
+    # SIMILARITY_REFRESH_SECONDS
+    def refresh(self):
+        now = time.monotonic()
+        if SIMILARITY_REFRESH_SECONDS <= 0 or now - self._refreshed_at < SIMILARITY_REFRESH_SECONDS:
+            return
+        self._refreshed_at = now
+        self._read(self._loaded_until - SIMILARITY_REFRESH_OVERLAP)
+
+    # Vector for a course; courses with an id are added to the index,
+    # ad-hoc text is only embedded
+    def vector_for(self, key, title, description):
+        if is_text_key(key):
+            return embed(course_text(title, description))
+        return self.add(key, title, description)
+
+    # Insert or update a course. Returns its vector. Changed text drops the
+    # course's cached results.
+    def add(self, key, title, description):
+        vector, record = self._upsert(key, title, description)
+        if record is not None:
+            self._store([record])
+        return vector
+
+    # Insert or update many (key, title, description) courses in one transaction
+    def add_many(self, courses):
+        records = [record for _, record in (self._upsert(*course) for course in courses) if record is not None]
+        if records:
+            self._store(records)
+
+    def _upsert(self, key, title, description):
+        text = course_text(title, description)
+        text_hash = hashlib.sha1(text.encode()).hexdigest()
+        with self._lock:
+            row = self.rows.get(key)
+            if row is not None and self.text_hashes[row] == text_hash:
+                return self.vectors[row].copy(), None
+
+            vector = embed(text)
+            if row is None:
+                self._grow()
+                row = self.rows[key] = len(self.keys)
+                self.keys.append(key)
+                self.titles.append(title)
+                self.text_hashes.append(text_hash)
+            else:
+                self.titles[row] = title
+                self.text_hashes[row] = text_hash
+                self.results.pop(key, None)
+            self.vectors[row] = vector
+        return vector, (key, title, text_hash, vector.astype(np.float16).tobytes(), time.time())
+
+    def _store(self, records):
+        with storage.connect(self.db_name) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO course_vectors (key, title, text_hash, vector, similar, updated_at) VALUES (?, ?, ?, ?, NULL, ?)",
+                records,
+            )
+
+    # Make room for one more row, doubling the capacity when full
+    def _grow(self):
+        if len(self.keys) < self.vectors.shape[0]:
+            return
+        capacity = max(64, self.vectors.shape[0] * 2)
+        grown = np.zeros((capacity, SIMILARITY_DIM), dtype=np.float32)
+        grown[: self.vectors.shape[0]] = self.vectors
+        self.vectors = grown
+
+    # Top-k (key, title, score) neighbours of a vector by cosine similarity
+    def query(self, vector, k=5, exclude=None):
+        with self._lock:
+            count = len(self.keys)
+            if count == 0:
+                return []
+            scores = self.vectors[:count] @ vector
+            if exclude in self.rows:
+                scores[self.rows[exclude]] = -np.inf
+            k = min(k, count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                (self.keys[i], self.titles[i], float(scores[i]))
+                for i in top if np.isfinite(scores[i])
+            ]
+
+    def vector(self, key):
+        with self._lock:
+            row = self.rows.get(key)
+            return None if row is None else self.vectors[row].copy()
+
+    def get_results(self, key):
+        if is_text_key(key):
+            return self.text_results.get(key)
+        return self.results.get(key)
+
+    def set_results(self, key, similar):
+        if is_text_key(key):
+            self.text_results.put(key, similar)
+            return
+        self.results[key] = similar
+        with storage.connect(self.db_name) as conn:
+            conn.execute(
+                "UPDATE course_vectors SET similar = ?, updated_at = ? WHERE key = ?",
+                (json.dumps(similar), time.time(), key),
+            )
+
+    def __len__(self):
+        return len(self.keys)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+# Process-wide index, loaded on first use and refreshed from SQLite
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SimilarityIndex()
+    _index.refresh()
+    return _index
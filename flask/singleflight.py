@@ -0,0 +1,48 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# Coalesces concurrent calls that share a key: the first caller runs the
+# function and every caller that arrives while it is in flight waits for,
+# and shares, its result or exception.
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {}  # label -> {"calls": n, "coalesced": n}
+
+    def do(self, key, fn, label="default"):
+        with self._lock:
+            counters = self.stats.setdefault(label, {"calls": 0, "coalesced": 0})
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                counters["calls"] += 1
+            else:
+                counters["coalesced"] += 1
+        return self._run(key, call, fn) if leader else self._wait(call)
+
+    def _run(self, key, call, fn):
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _wait(self, call):
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
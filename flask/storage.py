@@ -0,0 +1,29 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+# Root directory for the service's local caches and SQLite stores
+DATA_DIR = os.getenv("EDUSYNC_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data"))
+
+
+# Absolute path under DATA_DIR, creating parent directories as needed
+def data_path(*parts):
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+# Short-lived SQLite connection that commits on success and always closes
+@contextmanager
+def connect(name):
+    conn = sqlite3.connect(data_path(name), timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
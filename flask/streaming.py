@@ -0,0 +1,69 @@
+import json
+import re
+
+
+# Server-sent event frame with a JSON payload
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Incrementally parses streamed JSON text and returns each object of the array
+# under `key` as soon as its closing brace arrives, without waiting for the
+# rest of the document. Tracks strings and escapes so braces inside text
+# values are not mistaken for structure.
+class JsonArrayStreamParser:
+    def __init__(self, key):
+        self.key_pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self.buffer = ""
+        self.pos = 0
+        self.in_array = False
+        self.done = False
+        self.depth = 0
+        self.start = None
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text):
+        self.buffer += text
+        items = []
+
+        if not self.in_array:
+            match = self.key_pattern.search(self.buffer)
+            if not match:
+                return items
+            self.in_array = True
+            self.pos = match.end()
+
+        while self.pos < len(self.buffer) and not self.done:
+            char = self.buffer[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                if self.depth == 0:
+                    self.start = self.pos
+                self.depth += 1
+            elif char in "}]":
+                if self.depth == 0:
+                    # End of the array itself
+                    self.done = True
+                else:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        try:
+                            item = json.loads(self.buffer[self.start:self.pos + 1])
+                        except json.JSONDecodeError:
+                            item = None
+                        if isinstance(item, dict):
+                            items.append(item)
+                        # Drop parsed text so the buffer only holds the open item
+                        self.buffer = self.buffer[self.pos + 1:]
+                        self.pos = -1
+            self.pos += 1
+        return items
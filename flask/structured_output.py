@@ -0,0 +1,290 @@
+import json
+import os
+from typing import Dict, List, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+
+import llm_gateway
+import metrics
+
+# Follow-up calls asking the model to finish a cut-off answer, per request
+STRUCTURED_MAX_CONTINUATIONS = int(os.getenv("STRUCTURED_MAX_CONTINUATIONS", "1"))
+
+CONTINUE_PROMPT = (
+    "Your previous reply was cut off. Continue the JSON exactly where it stops. "
+    "Do not repeat anything already written and do not add any other text."
+)
+
+
+# Raised when a completion cannot be turned into a valid response; content
+# holds the last text the model produced
+class StructuredOutputError(ValueError):
+    def __init__(self, message, content):
+        super().__init__(message)
+        self.content = content
+
+
+# Response shapes. Unknown keys are allowed so the routes keep returning
+# exactly what the model produced; the schemas only reject unusable answers.
+class _Lenient(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+
+class QuizQuestion(_Lenient):
+    question: str
+    options: Dict[str, str]
+    answer: str
+
+
+class Quiz(_Lenient):
+    quiz: List[QuizQuestion]
+
+
+# Modules in a roadmap, as the roadmap prompts ask for
+ROADMAP_MODULES = 4
+
+
+class RoadmapQuiz(_Lenient):
+    questions: List[QuizQuestion] = Field(min_length=1)
+
+
+# Every part is required, so a module cut off by a repair is rejected
+# instead of served as a stub
+class RoadmapModule(_Lenient):
+    title: str = Field(min_length=1)
+    description: str = Field(min_length=1)
+    order: Optional[int] = None
+    contents: List[dict] = Field(min_length=1)
+    quiz: RoadmapQuiz
+
+
+class Roadmap(_Lenient):
+    modules: List[RoadmapModule] = Field(min_length=ROADMAP_MODULES)
+
+
+class OutlineModule(_Lenient):
+    title: str = Field(min_length=1)
+    description: str = ""
+
+
+class RoadmapOutline(_Lenient):
+    modules: List[OutlineModule] = Field(min_length=ROADMAP_MODULES)
+
+
+# Criteria descriptions are extra keys named after the request's criteria
+class Grade(_Lenient):
+    grade: Union[float, str]
+
+
+class ModuleSuggestions(_Lenient):
+    suggestions: Dict[str, List[str]]
+
+
+# Compiled once; validation runs in pydantic-core
+SCHEMAS = {
+    "quiz": TypeAdapter(Quiz),
+    "roadmap": TypeAdapter(Roadmap),
+    "roadmap_outline": TypeAdapter(RoadmapOutline),
+    "roadmap_module": TypeAdapter(RoadmapModule),
+    "grade": TypeAdapter(Grade),
+    "module_suggestions": TypeAdapter(ModuleSuggestions),
+}
+
+structured_output_total = metrics.Counter(
+    "edusync_structured_output_total",
+    "Structured completions by endpoint and how they were made valid",
+    ("endpoint", "result"),
+)
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _strip_trailing_comma(out):
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ",":
+        del out[i]
+
+
+# One pass over JSON text that fixes small defects (trailing commas, raw
+# newlines in strings, mismatched closers, text after the document) and
+# remembers the last point where the text could be cut and closed.
+# Returns (text, None) for a complete document, or (prefix, open containers)
+# when it ends early, where prefix is the text up to that last cut point.
+def _scan(text):
+    out = []
+    stack = []
+    expect_key = []  # Per open container: an object waiting for a key
+    in_string = escaped = string_is_key = False
+    safe = None
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+                if not string_is_key:
+                    out.append(char)
+                    safe = (len(out), tuple(stack))
+                    continue
+            elif char == "\n":
+                char = "\\n"
+            out.append(char)
+        elif char == '"':
+            in_string = True
+            string_is_key = bool(stack) and expect_key[-1]
+            out.append(char)
+        elif char in "{[":
+            stack.append(char)
+            expect_key.append(char == "{")
+            out.append(char)
+            safe = (len(out), tuple(stack))
+        elif char in "}]":
+            if not stack:
+                break
+            _strip_trailing_comma(out)
+            out.append(_CLOSERS[stack.pop()])
+            expect_key.pop()
+            if not stack:
+                return "".join(out), None
+            safe = (len(out), tuple(stack))
+        elif char == ",":
+            safe = (len(out), tuple(stack))
+            out.append(char)
+            if stack and stack[-1] == "{":
+                expect_key[-1] = True
+        elif char == ":":
+            out.append(char)
+            if stack and stack[-1] == "{":
+                expect_key[-1] = False
+        else:
+            out.append(char)
+    return "".join(out[: safe[0]]), safe[1]
+
+
+def _document_start(text):
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    return min(starts) if starts else None
+
+
+# Best-effort parse of truncated or slightly malformed JSON. Returns
+# (value, prefix, complete): the parsed value or None, the longest valid
+# prefix of the document to continue from, and whether the document was
+# complete rather than cut off.
+def repair_json(text):
+    start = _document_start(text)
+    if start is None:
+        return None, "", False
+    prefix, open_containers = _scan(text[start:])
+    complete = open_containers is None
+    candidate = prefix if complete else prefix + "".join(_CLOSERS[c] for c in reversed(open_containers))
+    try:
+        return json.loads(candidate), prefix, complete
+    except json.JSONDecodeError:
+        return None, prefix, complete
+
+
+def _validate(adapter, value):
+    try:
+        adapter.validate_python(value)
+        return True
+    except ValidationError:
+        return False
+
+
+# validate for llm_gateway.chat: cache only replies valid for the schema
+def _schema_check(adapter):
+    def validate(content):
+        try:
+            return _validate(adapter, json.loads(content))
+        except (TypeError, json.JSONDecodeError):
+            return False
+
+    return validate
+
+
+# The completion text, or for Groq's JSON mode the failed generation it
+# rejected (e.g. cut off by max_tokens), which is usually repairable
+def _completion(endpoint, params, adapter):
+    from groq import BadRequestError
+
+    try:
+        return llm_gateway.chat(endpoint, validate=_schema_check(adapter), **params)
+    except BadRequestError as e:
+        body = e.body if isinstance(e.body, dict) else {}
+        error = body.get("error", body)
+        if isinstance(error, dict) and error.get("failed_generation"):
+            return error["failed_generation"]
+        raise
+
+
+# Continue a cut-off answer from its last valid point. JSON mode is turned
+# off because the continuation is a fragment, not a document.
+def _continue(endpoint, params, prefix, adapter):
+    messages = list(params["messages"]) + [
+        {"role": "assistant", "content": prefix},
+        {"role": "user", "content": CONTINUE_PROMPT},
+    ]
+    continuation_params = dict(params, messages=messages)
+    continuation_params.pop("response_format", None)
+    continuation = _completion(endpoint, continuation_params, adapter).strip()
+    # Some models start over instead of continuing; a whole document wins
+    if continuation.startswith("{"):
+        value, _, complete = repair_json(continuation)
+        if complete and value is not None:
+            return continuation
+    return prefix + continuation
+
+
+# Raise StructuredOutputError unless value is valid for the named schema
+def check(schema, value):
+    if not _validate(SCHEMAS[schema], value):
+        raise StructuredOutputError(f"Value is not valid for the {schema} schema", json.dumps(value))
+
+
+# Parsed and schema-checked JSON for an endpoint's completion, validated
+# against the endpoint's schema unless another is named. Malformed output is
+# repaired locally. Output cut off mid-document is continued by the model
+# from its last valid point instead of regenerated from scratch, and the
+# repaired prefix is used if continuing does not work out.
+# Raises StructuredOutputError.
+def generate(endpoint, schema=None, **params):
+    adapter = SCHEMAS[schema or endpoint]
+    content = _completion(endpoint, params, adapter)
+    with metrics.stage("parse"):
+        try:
+            value = json.loads(content)
+            if _validate(adapter, value):
+                structured_output_total.inc(endpoint=endpoint, result="valid")
+                return value
+        except json.JSONDecodeError:
+            pass
+        value, prefix, complete = repair_json(content)
+
+    fallback = None
+    for attempt in range(STRUCTURED_MAX_CONTINUATIONS + 1):
+        if value is not None and _validate(adapter, value):
+            if complete or attempt == STRUCTURED_MAX_CONTINUATIONS:
+                structured_output_total.inc(endpoint=endpoint, result="repaired" if attempt == 0 else "continued")
+                return value
+            fallback = value
+        elif complete or attempt == STRUCTURED_MAX_CONTINUATIONS:
+            # A finished but unusable answer cannot be continued
+            break
+        try:
+            content = _continue(endpoint, params, prefix, adapter)
+        except Exception:
+            if fallback is None:
+                raise
+            break
+        with metrics.stage("parse"):
+            value, prefix, complete = repair_json(content)
+
+    if fallback is not None:
+        structured_output_total.inc(endpoint=endpoint, result="repaired")
+        return fallback
+    structured_output_total.inc(endpoint=endpoint, result="failed")
+    raise StructuredOutputError(f"Response for {endpoint} is not valid JSON for its schema", content)
@@ -0,0 +1,113 @@
+import json
+import math
+import os
+import re
+import time
+
+import metrics
+import storage
+from lru import LRUCache
+
+# Width of a performance band; students in the same band share suggestions
+MODULE_SUGGESTION_BAND = float(os.getenv("MODULE_SUGGESTION_BAND", "0.1"))
+# Seconds cached suggestions for a module stay valid
+MODULE_SUGGESTION_TTL = float(os.getenv("MODULE_SUGGESTION_TTL", str(7 * 24 * 3600)))
+# Modules kept in memory in front of SQLite
+MODULE_SUGGESTION_MEMORY = int(os.getenv("MODULE_SUGGESTION_MEMORY", "20000"))
+
+module_suggestion_lookups_total = metrics.Counter(
+    "edusync_module_suggestion_lookups_total", "Per-module suggestion cache lookups", ("result",)
+)
+
+
+def _normalize(name):
+    return re.sub(r"\s+", " ", str(name)).strip().lower()
+
+
+# Band index of a 0-1 performance score
+def band(performance):
+    bands = max(1, math.ceil(1 / MODULE_SUGGESTION_BAND))
+    return min(bands - 1, max(0, int(float(performance) / MODULE_SUGGESTION_BAND)))
+
+
+# (low, high) percentages of a band, for the prompt
+def band_range(index):
+    return round(index * MODULE_SUGGESTION_BAND * 100), round(min(1, (index + 1) * MODULE_SUGGESTION_BAND) * 100)
+
+
+# Suggestions per (course, module, performance band), in memory and SQLite
+class SuggestionCache:
+    def __init__(self, db_name="module_suggestions.db"):
+        self.db_name = db_name
+        self._memory = LRUCache(MODULE_SUGGESTION_MEMORY)
+        self._schema_ready = False
+
+    def _key(self, course_id, module, band_index):
+        return f"{course_id or ''}\x1f{band_index}\x1f{_normalize(module)}"
+
+    def _ensure_schema(self, conn):
+        if not self._schema_ready:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS module_suggestions (
+                    key TEXT PRIMARY KEY,
+                    suggestions TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            self._schema_ready = True
+
+    # {module: suggestions} for the modules that are cached
+    def get_many(self, course_id, modules, band_index):
+        found = {}
+        missing = {}
+        for module in modules:
+            key = self._key(course_id, module, band_index)
+            suggestions = self._memory.get(key)
+            if suggestions is not None:
+                found[module] = suggestions
+            else:
+                missing[key] = module
+        if missing:
+            keys = list(missing)
+            with storage.connect(self.db_name) as conn:
+                self._ensure_schema(conn)
+                rows = conn.execute(
+                    f"SELECT key, suggestions, expires_at FROM module_suggestions "
+                    f"WHERE key IN ({','.join('?' * len(keys))}) AND expires_at > ?",
+                    keys + [time.time()],
+                ).fetchall()
+            for row in rows:
+                suggestions = json.loads(row["suggestions"])
+                self._memory.put(row["key"], suggestions, ttl=row["expires_at"] - time.time())
+                found[missing[row["key"]]] = suggestions
+        module_suggestion_lookups_total.inc(len(found), result="hit")
+        module_suggestion_lookups_total.inc(len(modules) - len(found), result="miss")
+        return found
+
+    def put_many(self, course_id, suggestions, band_index):
+        expires_at = time.time() + MODULE_SUGGESTION_TTL
+        records = []
+        for module, items in suggestions.items():
+            key = self._key(course_id, module, band_index)
+            self._memory.put(key, items, ttl=MODULE_SUGGESTION_TTL)
+            records.append((key, json.dumps(items), expires_at))
+        if records:
+            with storage.connect(self.db_name) as conn:
+                self._ensure_schema(conn)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO module_suggestions (key, suggestions, expires_at) VALUES (?, ?, ?)",
+                    records,
+                )
+                conn.execute("DELETE FROM module_suggestions WHERE expires_at <= ?", (time.time(),))
+
+
+# Suggestions from a model response for the requested modules, matching
+# keys loosely since the model may change their case or spacing
+def match_modules(modules, generated):
+    by_name = {_normalize(name): items for name, items in generated.items()}
+    return {module: by_name[_normalize(module)] for module in modules if _normalize(module) in by_name}
+
+
+suggestion_cache = SuggestionCache()
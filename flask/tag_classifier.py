@@ -0,0 +1,135 @@
+import os
+import re
+
+import numpy as np
+
+# The fixed tag vocabulary offered to students
+TAGS = [
+    "Programming", "Data Science", "Machine Learning", "Artificial Intelligence", "Web Development",
+    "Mobile Development", "Cloud Computing", "Cybersecurity", "Software Engineering", "Database Management",
+    "DevOps", "UI/UX Design", "Game Development", "Blockchain", "Internet of Things (IoT)", "Big Data",
+    "Business Analytics", "Project Management", "Digital Marketing", "Finance", "Entrepreneurship",
+    "Leadership", "Communication Skills", "Creative Writing", "Graphic Design", "Photography",
+    "Music Production", "Language Learning", "Mathematics", "Physics", "Biology", "Chemistry", "History",
+    "Psychology", "Philosophy",
+]
+
+# Keywords describing each tag; together with the tag name they form the
+# document each tag centroid is built from
+TAG_KEYWORDS = {
+    "Programming": "programming coding code coder programmer python java javascript c++ c# rust golang algorithms scripting technology computer",
+    "Data Science": "data science scientist analysis analyze statistics pandas numpy visualization dataset insights jupyter",
+    "Machine Learning": "machine learning ml model models neural networks deep learning training prediction scikit tensorflow pytorch",
+    "Artificial Intelligence": "artificial intelligence ai chatbot llm gpt robots robotics intelligent agents nlp vision automation",
+    "Web Development": "web website websites frontend backend fullstack html css javascript react node django flask browser",
+    "Mobile Development": "mobile app apps android ios swift kotlin flutter smartphone phone",
+    "Cloud Computing": "cloud aws azure gcp serverless servers hosting infrastructure scalable computing",
+    "Cybersecurity": "cybersecurity security hacking hacker ethical penetration testing encryption privacy network defense",
+    "Software Engineering": "software engineering engineer architecture design patterns testing systems development building products",
+    "Database Management": "database databases sql mysql postgres mongodb queries storage schema dba",
+    "DevOps": "devops docker kubernetes ci cd pipelines deployment automation linux infrastructure",
+    "UI/UX Design": "ui ux user experience interface design designer usability figma prototyping wireframes creative",
+    "Game Development": "game games gaming unity unreal gamer developer level design 3d",
+    "Blockchain": "blockchain crypto cryptocurrency bitcoin ethereum web3 smart contracts nft decentralized",
+    "Internet of Things (IoT)": "iot internet things sensors arduino raspberry pi embedded hardware electronics devices smart home",
+    "Big Data": "big data hadoop spark streaming large scale warehouse pipelines",
+    "Business Analytics": "business analytics analyst excel dashboards reporting kpi metrics bi tableau power",
+    "Project Management": "project management manager agile scrum planning organizing deadlines teams coordination",
+    "Digital Marketing": "digital marketing seo social media advertising ads content brand branding growth influencer",
+    "Finance": "finance financial investing investment stocks trading money banking accounting economics budget",
+    "Entrepreneurship": "entrepreneurship entrepreneur startup startups business founder founding venture ideas innovation",
+    "Leadership": "leadership leader leading lead teams management mentoring motivating vision captain",
+    "Communication Skills": "communication speaking public presentation presentations debate networking people interpersonal",
+    "Creative Writing": "creative writing writer write stories story poetry poems novel fiction blogging author creative",
+    "Graphic Design": "graphic design designer illustration drawing art artist photoshop illustrator logo visual creative",
+    "Photography": "photography photographer photos photo camera editing lightroom pictures filming visual",
+    "Music Production": "music production producer songs song beats audio mixing singing guitar piano musician instrument",
+    "Language Learning": "language languages learning spanish french german japanese english linguistics speaking fluent",
+    "Mathematics": "mathematics math maths algebra calculus geometry numbers statistics probability proofs",
+    "Physics": "physics physicist quantum mechanics astronomy space universe energy relativity",
+    "Biology": "biology biologist life cells genetics dna ecology animals plants medicine health",
+    "Chemistry": "chemistry chemist chemical reactions molecules lab laboratory organic compounds",
+    "History": "history historical past ancient civilizations wars culture heritage archaeology",
+    "Psychology": "psychology psychologist mind behavior behaviour mental health emotions therapy cognitive",
+    "Philosophy": "philosophy philosopher ethics logic existence meaning thinking morality metaphysics",
+}
+
+# Minimum cosine similarity of the best tag for the local answer to be trusted
+TAG_CONFIDENCE_THRESHOLD = float(os.getenv("TAG_CONFIDENCE_THRESHOLD", "0.2"))
+# Tags scoring below this fraction of the best tag are not assigned
+TAG_RELATIVE_CUTOFF = float(os.getenv("TAG_RELATIVE_CUTOFF", "0.25"))
+TAG_TOP_K = 5
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9+#]+")
+_STOP_WORDS = {"a", "an", "and", "the", "of", "in", "on", "to", "for", "with", "thing", "things"}
+
+
+# Crude suffix stripping so "coding"/"code" and "designer"/"design" meet
+def _stem(word):
+    for suffix in ("ing", "ers", "er", "ies", "es", "s"):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[: -len(suffix)]
+    return word
+
+
+def _tokens(text):
+    return [_stem(word) for word in _TOKEN_PATTERN.findall(text.lower()) if word not in _STOP_WORDS]
+
+
+# TF-IDF centroid classifier over the tag vocabulary
+class TagClassifier:
+    def __init__(self, tags, keywords):
+        self.tags = tags
+        documents = [_tokens(f"{tag} {tag} {keywords.get(tag, '')}") for tag in tags]
+        self.vocabulary = {}
+        for tokens in documents:
+            for token in tokens:
+                self.vocabulary.setdefault(token, len(self.vocabulary))
+
+        # Smoothed inverse document frequency across the tag documents
+        document_frequency = np.zeros(len(self.vocabulary))
+        for tokens in documents:
+            for token in set(tokens):
+                document_frequency[self.vocabulary[token]] += 1
+        self.idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+
+        self.centroids = self.vectorize([" ".join(tokens) for tokens in documents], stemmed=True)
+
+    # L2-normalized TF-IDF rows for a batch of texts
+    def vectorize(self, texts, stemmed=False):
+        matrix = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = text.split() if stemmed else _tokens(text)
+            for token in tokens:
+                column = self.vocabulary.get(token)
+                if column is not None:
+                    matrix[row, column] += 1
+        matrix = np.log1p(matrix) * self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    # For each text, (tags, confidence): up to TAG_TOP_K tags, best first, and
+    # the similarity of the best tag. Low confidence means the text is vague.
+    def classify(self, texts, top_k=TAG_TOP_K):
+        scores = self.vectorize(texts) @ self.centroids.T
+        order = np.argsort(-scores, axis=1)[:, :top_k]
+        results = []
+        for row, columns in enumerate(order):
+            best = float(scores[row, columns[0]])
+            tags = [
+                self.tags[c] for c in columns
+                if scores[row, c] > 0 and scores[row, c] >= best * TAG_RELATIVE_CUTOFF
+            ]
+            results.append((tags, best))
+        return results
+
+
+classifier = TagClassifier(TAGS, TAG_KEYWORDS)
+
+
+# Tags for one description, or None when it is too vague to answer locally
+def assign_tags_locally(about_text):
+    tags, confidence = classifier.classify([about_text])[0]
+    if confidence < TAG_CONFIDENCE_THRESHOLD or not tags:
+        return None
+    return tags